@@ -1,13 +1,49 @@
 import os
 import re
+import math
 import jwt
-from google import genai
+import json
+import time
+import hashlib
+import tempfile
+import threading
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g, has_request_context
 from flask_cors import CORS
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
+import prompts
 from prompts import *
+from executor import execute_code
+from minify import minify_css, minify_html, html_context
+from cache import CACHE_PATH, CACHE_TTL, SharedCache
+from jobs import JobStore, JOB_WORKERS
+from profiles import (
+    ProfileStats,
+    load_profiles,
+    resolve_profile,
+    generation_config,
+    hit_token_limit,
+    truncate_output,
+    OutputTruncated,
+)
+from deadlines import (
+    CANCEL_POLL_INTERVAL,
+    DEFAULT_DEADLINE,
+    ENDPOINT_DEADLINES,
+    UpstreamCancelled,
+    RunRegistry,
+    client_disconnected,
+)
+from retries import QuotaGate, call_with_retries
+from scheduler import (
+    ANONYMOUS_WEIGHT,
+    ENDPOINT_PRIORITIES,
+    SIGNED_IN_WEIGHT,
+    UpstreamScheduler,
+)
+from usage import UsageMeter, token_counts
 
 valid_languages = {
     "python",
@@ -33,6 +69,7 @@ valid_languages = {
 
 app = Flask(__name__)
 
+# Every JSON POST is preflighted; let browsers reuse the answer.
 CORS(app)
 
 try:
@@ -45,7 +82,87 @@ CODE_REGEX = r"```(?:\w+\n)?(.*?)```"
 api_key = os.getenv("GEMINI_API_KEY")
 gemini_model = os.getenv("GEMINI_MODEL")
 gemini_model_1 = os.getenv("GEMINI_MODEL_1")
+gemini_base_url = os.getenv("GEMINI_BASE_URL")
 SECRET_KEY = os.getenv("JWT_SECRET")
+# Users allowed to read service-wide reports that cover other users.
+ADMIN_USER_IDS = {
+    user_id.strip()
+    for user_id in os.getenv("ADMIN_USER_IDS", "").split(",")
+    if user_id.strip()
+}
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.getenv(
+    "SAMPLES_DIR", os.path.join(BASE_DIR, "..", "..", "Frontend", "src", "samples")
+)
+SAMPLE_OUTPUTS_PATH = os.getenv(
+    "SAMPLE_OUTPUTS_PATH", os.path.join(BASE_DIR, "sample_outputs.json")
+)
+# Sample outputs are built ahead of deploys with `flask --app app
+# precompute-samples` and shipped in SAMPLE_OUTPUTS_PATH; computing them
+# at startup would have every worker spend model calls on them.
+PRECOMPUTE_SAMPLES = os.getenv("PRECOMPUTE_SAMPLES", "false").lower() == "true"
+PRELOAD_SDK = os.getenv("GENAI_PRELOAD_SDK", "false").lower() == "true"
+
+# Routes that can also run as background jobs, by path.
+JOB_ENDPOINTS = {
+    "generate_code": "generate_code",
+    "get-output": "get_output_api",
+    "refactor_code": "refactor_code_api",
+    "htmlcssjsgenerate-code": "htmlcssjs_generate",
+    "htmlcssjsrefactor-code": "htmlcssjs_refactor",
+}
+MAX_JOB_WAIT = 30
+MIN_EDITOR_ID_LENGTH = 32
+JOB_POLL_INTERVAL = 0.25
+
+PREFETCH_WORKERS = int(os.getenv("GENAI_PREFETCH_WORKERS", 2))
+PREFETCH_LIMIT = int(os.getenv("GENAI_PREFETCH_LIMIT", 30))
+PREFETCH_WINDOW = int(os.getenv("GENAI_PREFETCH_WINDOW", 10 * 60))
+PREFETCH_TTL = 60
+
+# Page documents a client has sent or been sent, addressed by sha256 so
+# unchanged files can be referenced instead of uploaded again.
+CONTEXT_PATH = os.getenv(
+    "GENAI_CONTEXT_PATH", os.path.join(os.path.dirname(CACHE_PATH), "genai-context.db")
+)
+CONTEXT_MAX_ENTRIES = int(os.getenv("GENAI_CONTEXT_MAX_ENTRIES", 5000))
+CONTEXT_TTL = int(os.getenv("GENAI_CONTEXT_TTL", 2 * 60 * 60))
+GENERATE_CONTEXT_FIELDS = {"htmlContent": "htmlHash", "cssContent": "cssHash"}
+REFACTOR_CONTEXT_FIELDS = {"html": "htmlHash", "css": "cssHash", "js": "jsHash"}
+
+# Template names by template text, for the heaviest-prompts report.
+PROMPT_NAMES = {
+    template: name
+    for name, template in vars(prompts).items()
+    if isinstance(template, str) and not name.startswith("_")
+}
+PROMPT_NAMES.update(
+    {
+        template: f"languages_prompts[{language}]"
+        for language, template in languages_prompts.items()
+    }
+)
+MAX_USAGE_REPORT = 50
+
+genai = None
+genai_client = None
+genai_lock = threading.Lock()
+generation_profiles = load_profiles()
+profile_stats = ProfileStats()
+response_cache = SharedCache()
+context_store = SharedCache(CONTEXT_PATH, CONTEXT_MAX_ENTRIES)
+job_store = JobStore()
+run_registry = RunRegistry()
+quota_gate = QuotaGate()
+upstream_scheduler = UpstreamScheduler()
+usage_meter = UsageMeter()
+job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+prefetches = {}
+prefetch_lock = threading.Lock()
+sample_outputs = {}
+sample_refresh_lock = threading.Lock()
 
 
 def token_required(f):
@@ -71,26 +188,381 @@ def token_required(f):
     return decorator
 
 
+def token_optional(f):
+    # Routes open to anonymous callers still sign the request in when it
+    # carries a valid token, so the call is charged to that user.
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        auth_header = request.headers.get("Authorization", "")
+        if auth_header.startswith("Bearer "):
+            try:
+                request.user_data = jwt.decode(
+                    auth_header.split(" ")[1], SECRET_KEY, algorithms=["HS256"]
+                )
+            except jwt.InvalidTokenError:
+                pass
+
+        return f(*args, **kwargs)
+
+    return decorator
+
+
+def is_admin():
+    return str(request_user_id()) in ADMIN_USER_IDS
+
+
+def admin_required(f):
+    # Goes below @token_required, which sets request.user_data.
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        if not is_admin():
+            return jsonify({"message": "Admin access required!"}), 403
+
+        return f(*args, **kwargs)
+
+    return decorator
+
+
+def load_genai():
+    # google.genai takes most of a second to import, so it is loaded on
+    # the first model call rather than at startup.
+    global genai
+    with genai_lock:
+        if genai is None:
+            from google import genai as genai_module
+
+            genai = genai_module
+    return genai
+
+
+def load_genai_client():
+    # One client for every call. Each Client opens its own httpx pool, so a
+    # client per call left a connection behind each time. Every call runs
+    # on the upstream loop, which the client's async pool is bound to.
+    global genai_client
+    genai_module = load_genai()
+    with genai_lock:
+        if genai_client is None:
+            genai_client = genai_module.Client(
+                api_key=api_key,
+                http_options={"base_url": gemini_base_url} if gemini_base_url else {},
+            )
+    return genai_client
+
+
+@app.before_request
+def start_deadline():
+    g.deadline = time.monotonic() + ENDPOINT_DEADLINES.get(
+        request.endpoint, DEFAULT_DEADLINE
+    )
+
+    # A run that names its editor supersedes the previous run from the same
+    # user and editor on the same endpoint. Short IDs are guessable or
+    # shared (an old client sent just the language), so they are ignored.
+    editor_id = request.headers.get("X-Editor-ID")
+    if (
+        editor_id
+        and len(editor_id) >= MIN_EDITOR_ID_LENGTH
+        and request.endpoint in ENDPOINT_DEADLINES
+    ):
+        g.run_key = SharedCache.key_for(
+            request_identity(), editor_id, request.endpoint
+        )
+        # A prefetch only supersedes the last one once start_prefetch knows
+        # it is starting a new computation.
+        if request.endpoint != "prefetch_output":
+            g.run_generation = run_registry.claim(g.run_key)
+
+
+@app.after_request
+def add_retry_after(response):
+    retry_after = g.get("retry_after")
+    if retry_after is not None and response.status_code in (429, 503):
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def request_identity():
+    return request.headers.get("Authorization") or request.remote_addr
+
+
+def request_user_id():
+    if not has_request_context():
+        return None
+    return (getattr(request, "user_data", None) or {}).get("userId")
+
+
+def prompt_name(template):
+    return PROMPT_NAMES.get(template, "unknown")
+
+
+def upstream_slot(deadline):
+    # Calls made outside a request, such as the sample precompute, run in
+    # the batch class.
+    if not has_request_context():
+        return upstream_scheduler.slot(
+            "batch", None, ANONYMOUS_WEIGHT, deadline, cancellation_reason
+        )
+
+    user_id = request_user_id()
+    return upstream_scheduler.slot(
+        ENDPOINT_PRIORITIES.get(request.endpoint, "batch"),
+        user_id or request.remote_addr,
+        SIGNED_IN_WEIGHT if user_id else ANONYMOUS_WEIGHT,
+        deadline,
+        cancellation_reason,
+        key=g.get("prefetch_key"),
+    )
+
+
+def cancellation_reason():
+    if not has_request_context():
+        return None
+    if client_disconnected(request.environ):
+        return "disconnected"
+    run_key = g.get("run_key")
+    if run_key and run_registry.current(run_key) != g.run_generation:
+        return "superseded"
+    return None
+
+
+def content_cache_key(model, cache_parts, profile_name, language):
+    return SharedCache.key_for(model, profile_name, language, *cache_parts)
+
+
+def output_cache_key(code, language):
+    return content_cache_key(
+        gemini_model, ("output", language, code), "output", language
+    )
+
+
+def generate_content(
+    model,
+    contents,
+    cache_parts=None,
+    profile_name="default",
+    language=None,
+    template=None,
+):
+    # Prompts that embed the current time pass cache_parts so the cache key
+    # is built from the request instead of the prompt.
+    key = content_cache_key(
+        model, cache_parts or (contents,), profile_name, language
+    )
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    user_id = request_user_id()
+    if usage_meter.over_budget(user_id):
+        g.retry_after = usage_meter.window_remaining()
+        raise UpstreamCancelled("over_budget", retry_after=g.retry_after)
+
+    deadline = g.get("deadline") if has_request_context() else None
+    if deadline is None:
+        deadline = time.monotonic() + DEFAULT_DEADLINE
+
+    client = load_genai_client()
+    profile_key = f"{profile_name}:{language}" if language else profile_name
+    profile = resolve_profile(generation_profiles, profile_name, language)
+
+    async def request_content(timeout):
+        return await client.aio.models.generate_content(
+            model=model,
+            contents=contents,
+            config={
+                **generation_config(profile),
+                "http_options": {"timeout": int(timeout * 1000)},
+            },
+        )
+
+    started = time.monotonic()
+    try:
+        response = call_with_retries(
+            request_content,
+            deadline,
+            cancellation_reason,
+            run_registry,
+            quota_gate,
+            str(model),
+            lambda: upstream_slot(deadline),
+        )
+    except UpstreamCancelled as e:
+        if e.retry_after is not None and has_request_context():
+            g.retry_after = e.retry_after
+        raise
+    usage_meter.record(
+        user_id,
+        request.endpoint if has_request_context() else "precompute",
+        language,
+        model,
+        template or profile_name,
+        token_counts(response),
+    )
+    text, truncated = truncate_output(
+        response.text, profile, hit_token_limit(response)
+    )
+    profile_stats.record(
+        profile_key, time.monotonic() - started, len(text), truncated
+    )
+    if truncated and profile.get("reject_truncated"):
+        raise OutputTruncated()
+
+    # Profiles can shorten the TTL; program output may print the time or
+    # random values, so "output" entries only live long enough for a Run
+    # to pick up its prefetch.
+    if text:
+        response_cache.set(key, text, profile.get("cache_ttl", CACHE_TTL))
+    return text
+
+
 def get_generated_code(problem_description, language):
     try:
         if language not in valid_languages:
             return "Error: Unsupported language."
 
-        client = genai.Client(api_key=api_key)
-
-        response = client.models.generate_content(
-            model=gemini_model,
-            contents=generate_code_prompt.format(
+        return generate_content(
+            gemini_model,
+            generate_code_prompt.format(
                 problem_description=problem_description, language=language
             ),
-        )
-        return response.text.strip()
+            profile_name="generate_code",
+            language=language,
+            template=prompt_name(generate_code_prompt),
+        ).strip()
+    except UpstreamCancelled:
+        raise
     except Exception as e:
         return ""
 
 
-def get_output(code, language):
+def get_output(code, language, stdin_data=None):
+    if stdin_data is None:
+        output = sample_outputs.get(sample_key(code, language))
+        if output is not None:
+            return output
+
+        output = attach_prefetch(code, language)
+        if output is not None:
+            return output
+
+    return generate_output(code, language, stdin_data)
+
+
+def attach_prefetch(code, language):
+    # A Run for code the editor already prefetched waits on that result
+    # instead of starting a second upstream call. The prefetch is moved up
+    # to the Run's class, so the Run does not queue as a batch call.
+    key = sample_key(code, language)
+    with prefetch_lock:
+        entry = prefetches.get(key)
+    if entry is None:
+        return None
+
+    if not entry[0].done() and has_request_context():
+        upstream_scheduler.promote(
+            key, ENDPOINT_PRIORITIES.get(request.endpoint, "interactive")
+        )
+
+    future = entry[0]
+    deadline = g.get("deadline") if has_request_context() else None
+    if deadline is None:
+        deadline = time.monotonic() + DEFAULT_DEADLINE
+
+    while not wait([future], timeout=CANCEL_POLL_INTERVAL)[0]:
+        reason = "deadline" if time.monotonic() >= deadline else cancellation_reason()
+        if reason:
+            raise UpstreamCancelled(reason)
+
+    try:
+        return future.result()
+    except UpstreamCancelled:
+        return None
+
+
+def run_prefetch(code, language, run_key, run_generation, user_data):
+    with app.test_request_context("/get-output/prefetch", method="POST"):
+        # Charged to the signed-in user like a Run.
+        if user_data:
+            request.user_data = user_data
+        g.deadline = time.monotonic() + ENDPOINT_DEADLINES["prefetch_output"]
+        g.run_key = run_key
+        g.run_generation = run_generation
+        g.prefetch_key = sample_key(code, language)
+        return generate_output(code, language)
+
+
+def start_prefetch(code, language):
+    # Returns the prefetch's status, or None when the caller is over the
+    # prefetch cap. Only a call that starts a new computation is charged,
+    # and only that call supersedes the editor's previous prefetch.
+    key = sample_key(code, language)
+    now = time.monotonic()
+
+    with prefetch_lock:
+        for stale_key, stale_entry in list(prefetches.items()):
+            if stale_entry[1] is not None and now - stale_entry[1] > PREFETCH_TTL:
+                del prefetches[stale_key]
+
+        entry = prefetches.get(key)
+        if entry is not None and not prefetch_superseded(entry):
+            return "ready" if entry[0].done() else "running"
+
+        # Signed-in users get their own cap wherever they connect from;
+        # anonymous callers share one per address.
+        if not run_registry.charge(
+            SharedCache.key_for(request_user_id() or request.remote_addr, "prefetch"),
+            PREFETCH_LIMIT,
+            PREFETCH_WINDOW,
+        ):
+            return None
+
+        run_key = g.get("run_key")
+        run_generation = run_registry.claim(run_key) if run_key else None
+        future = prefetch_pool.submit(
+            run_prefetch,
+            code,
+            language,
+            run_key,
+            run_generation,
+            getattr(request, "user_data", None),
+        )
+        entry = prefetches[key] = [future, None, run_key, run_generation]
+
+    def finished(_):
+        with prefetch_lock:
+            current = prefetches.get(key) is entry
+            # A cancelled or failed prefetch has nothing for a Run to pick
+            # up, so it is dropped rather than reported as ready.
+            if future.exception() is None:
+                entry[1] = time.monotonic()
+            elif current:
+                del prefetches[key]
+        # A replacement already running under the same key keeps its
+        # promotion.
+        if current:
+            upstream_scheduler.forget(key)
+
+    future.add_done_callback(finished)
+    return "started"
+
+
+def prefetch_superseded(entry):
+    # A later prefetch from the same editor is about to cancel this one.
+    future, _, run_key, run_generation = entry
+    return (
+        run_key is not None
+        and not future.done()
+        and run_registry.current(run_key) != run_generation
+    )
+
+
+def generate_output(code, language, stdin_data=None):
     try:
+        output = execute_code(code, language, stdin_data)
+        if output is not None:
+            return output
+
         if language in languages_prompts:
             prompt = languages_prompts[language].format(
                 code=code, time=utc_time_reference()
@@ -98,14 +570,16 @@ def get_output(code, language):
         else:
             return "Error: Language not supported."
 
-        client = genai.Client(api_key=api_key)
-
-        response = client.models.generate_content(
-            model=gemini_model,
-            contents=prompt,
+        return generate_content(
+            gemini_model,
+            prompt,
+            ("output", language, code),
+            profile_name="output",
+            language=language,
+            template=prompt_name(languages_prompts[language]),
         )
-
-        return response.text
+    except UpstreamCancelled:
+        raise
     except Exception as e:
         return f"Error: Unable to process the code. {str(e)}"
 
@@ -115,8 +589,6 @@ def refactor_code(code, language, problem_description=None):
         if language not in valid_languages:
             return "Error: Unsupported language."
 
-        client = genai.Client(api_key=api_key)
-
         if problem_description:
             refactor_contnet = refactor_code_prompt_user.format(
                 code=code,
@@ -126,16 +598,25 @@ def refactor_code(code, language, problem_description=None):
         else:
             refactor_contnet = refactor_code_prompt.format(code=code, language=language)
 
-        response = client.models.generate_content(
-            model=gemini_model,
-            contents=refactor_contnet,
+        response_text = generate_content(
+            gemini_model,
+            refactor_contnet,
+            profile_name="refactor_code",
+            language=language,
+            template=prompt_name(
+                refactor_code_prompt_user
+                if problem_description
+                else refactor_code_prompt
+            ),
         )
 
         return (
-            response.text.strip()
-            if hasattr(response, "text")
+            response_text.strip()
+            if response_text
             else "Error: Invalid response format."
         )
+    except UpstreamCancelled:
+        raise
     except Exception as e:
         print(f"Error analyzing code: {e}")
         return ""
@@ -151,15 +632,15 @@ def refactor_code_html_css_js(prompt, params, problem_description=None):
         else:
             formatted_prompt = prompt.format(**params)
 
-        client = genai.Client(api_key=api_key)
-
-        response = client.models.generate_content(
-            model=gemini_model_1,
-            contents=formatted_prompt,
-        )
-
-        result = response.text.strip()
+        result = generate_content(
+            gemini_model_1,
+            formatted_prompt,
+            profile_name="refactor_page",
+            template=prompt_name(prompt),
+        ).strip()
         return result
+    except (UpstreamCancelled, OutputTruncated):
+        raise
     except Exception as e:
         return f"Error: {e}"
 
@@ -167,48 +648,95 @@ def refactor_code_html_css_js(prompt, params, problem_description=None):
 def generate_html(prompt):
     formatted_prompt = html_prompt.format(prompt=prompt, time=utc_time_reference())
 
-    client = genai.Client(api_key=api_key)
-
-    response = client.models.generate_content(
-        model=gemini_model_1,
-        contents=formatted_prompt,
+    response_text = generate_content(
+        gemini_model_1,
+        formatted_prompt,
+        ("html", prompt),
+        profile_name="generate_page",
+        language="html",
+        template=prompt_name(html_prompt),
     )
-    return extract_code(response.text)
+    return extract_code(response_text)
 
 
 def generate_css(html_content, project_description):
     formatted_prompt = css_prompt.format(
-        html_content=html_content,
+        html_content=html_context(html_content),
         project_description=project_description,
         time=utc_time_reference(),
     )
 
-    client = genai.Client(api_key=api_key)
-
-    response = client.models.generate_content(
-        model=gemini_model_1,
-        contents=formatted_prompt,
+    response_text = generate_content(
+        gemini_model_1,
+        formatted_prompt,
+        ("css", html_content, project_description),
+        profile_name="generate_page",
+        language="css",
+        template=prompt_name(css_prompt),
     )
 
-    return extract_code(response.text)
+    return extract_code(response_text)
 
 
 def generate_js(html_content, css_content, project_description):
     formatted_prompt = js_prompt.format(
-        html_content=html_content,
-        css_content=css_content,
+        html_content=html_context(html_content),
+        css_content=minify_css(css_content),
         project_description=project_description,
         time=utc_time_reference(),
     )
 
-    client = genai.Client(api_key=api_key)
-
-    response = client.models.generate_content(
-        model=gemini_model_1,
-        contents=formatted_prompt,
+    response_text = generate_content(
+        gemini_model_1,
+        formatted_prompt,
+        ("js", html_content, css_content, project_description),
+        profile_name="generate_page",
+        language="js",
+        template=prompt_name(js_prompt),
     )
 
-    return extract_code(response.text)
+    return extract_code(response_text)
+
+
+def context_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def context_key(content_hash):
+    return SharedCache.key_for("context", request.user_data.get("userId"), content_hash)
+
+
+def resolve_context(data, fields):
+    # Full documents are stored under their hash; hash-only fields are
+    # filled in from the store. Returns the hash fields it did not know.
+    unknown = []
+    for field, hash_field in fields.items():
+        content = data.get(field)
+        if content:
+            context_store.set(context_key(context_hash(content)), content, CONTEXT_TTL)
+        elif data.get(hash_field):
+            content = context_store.get(context_key(data[hash_field]))
+            if content is None:
+                unknown.append(hash_field)
+            else:
+                data[field] = content
+    return unknown
+
+
+def remember_context(result):
+    for field, content in list(result.items()):
+        if content:
+            content_hash = context_hash(content)
+            context_store.set(context_key(content_hash), content, CONTEXT_TTL)
+            result[f"{field}Hash"] = content_hash
+    return result
+
+
+def unknown_context_response(unknown):
+    return (
+        jsonify({"error": "Unknown context hash", "unknownHashes": unknown}),
+        412,
+    )
 
 
 def utc_time_reference():
@@ -221,11 +749,108 @@ def extract_code(output):
         return match.group(1)
 
 
+def sample_key(code, language):
+    normalized = code.replace("\r\n", "\n").strip()
+    return hashlib.sha256(f"{language}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+def load_samples():
+    # Samples are named after their language, e.g. python.py or cpp.cpp.
+    if not os.path.isdir(SAMPLES_DIR):
+        return []
+
+    samples = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        language = os.path.splitext(name)[0]
+        if language in languages_prompts:
+            with open(os.path.join(SAMPLES_DIR, name)) as sample:
+                samples.append((language, sample.read()))
+    return samples
+
+
+def load_sample_outputs():
+    try:
+        with open(SAMPLE_OUTPUTS_PATH) as outputs:
+            sample_outputs.update(json.load(outputs))
+    except (OSError, ValueError):
+        pass
+
+
+def precompute_sample_outputs(force=False):
+    # Outputs are keyed by a hash of the sample source, so editing a sample
+    # recomputes just that one and entries for removed samples are dropped.
+    with sample_refresh_lock:
+        computed = {}
+        for language, code in load_samples():
+            key = sample_key(code, language)
+            output = None if force else sample_outputs.get(key)
+            if output is None:
+                try:
+                    output = generate_output(code, language)
+                except UpstreamCancelled:
+                    continue
+                if not output or output.startswith("Error:"):
+                    continue
+            computed[key] = output
+
+        sample_outputs.clear()
+        sample_outputs.update(computed)
+
+        # A staging file of its own, so workers refreshing at the same time
+        # never write into each other's file.
+        staging_fd, staging_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(SAMPLE_OUTPUTS_PATH)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(staging_fd, "w") as outputs:
+                json.dump(computed, outputs, indent=2, sort_keys=True)
+            os.replace(staging_path, SAMPLE_OUTPUTS_PATH)
+        finally:
+            if os.path.exists(staging_path):
+                os.unlink(staging_path)
+
+        return len(computed)
+
+
+def run_job(job_id, path, payload, headers):
+    # Replays the request against the route itself, so a job gets exactly
+    # the validation and response body the synchronous call would.
+    job_store.start(job_id)
+    try:
+        with app.test_request_context(
+            f"/{path}", method="POST", json=payload, headers=headers
+        ):
+            g.deadline = time.monotonic() + ENDPOINT_DEADLINES.get(
+                JOB_ENDPOINTS[path], DEFAULT_DEADLINE
+            )
+            response = app.make_response(app.view_functions[JOB_ENDPOINTS[path]]())
+        job_store.finish(job_id, response.status_code, response.get_json())
+    except Exception as e:
+        job_store.finish(job_id, 500, {"error": str(e)})
+
+
+@app.cli.command("precompute-samples")
+def precompute_samples_command():
+    print(f"Precomputed {precompute_sample_outputs(force=True)} sample outputs")
+
+
+load_sample_outputs()
+if PRECOMPUTE_SAMPLES:
+    threading.Thread(target=precompute_sample_outputs, daemon=True).start()
+elif PRELOAD_SDK:
+    threading.Thread(target=load_genai, daemon=True).start()
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 
+@app.route("/health")
+def health():
+    return jsonify({"status": "ok", "sdkLoaded": genai is not None}), 200
+
+
 @app.route("/generate_code", methods=["POST"])
 @token_required
 def generate_code():
@@ -234,25 +859,75 @@ def generate_code():
         language = request.json["language"]
         generated_code = get_generated_code(problem_description, language)
         return jsonify({"code": extract_code(generated_code)})
+    except UpstreamCancelled as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
 @app.route("/get-output", methods=["POST"])
+@token_optional
 def get_output_api():
     try:
         code = request.json["code"]
         language = request.json["language"]
+        stdin_data = request.json.get("input")
 
         if not code or not language:
             return jsonify({"error": "Missing code or language"}), 400
 
-        output = get_output(code, language)
+        if stdin_data is not None and not isinstance(stdin_data, str):
+            return jsonify({"error": "'input' must be a string"}), 400
+
+        output = get_output(code, language, stdin_data)
         return jsonify({"output": output})
+    except UpstreamCancelled as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
+@app.route("/get-output/prefetch", methods=["POST"])
+@token_optional
+def prefetch_output():
+    try:
+        data = request.get_json(silent=True) or {}
+        code = data.get("code")
+        language = data.get("language")
+
+        if not code or not language:
+            return jsonify({"error": "Missing code or language"}), 400
+
+        if language not in languages_prompts:
+            return jsonify({"error": "Language not supported"}), 400
+
+        if sample_key(code, language) in sample_outputs or response_cache.get(
+            output_cache_key(code, language)
+        ):
+            return jsonify({"status": "ready"}), 200
+
+        status = start_prefetch(code, language)
+        if status is None:
+            return jsonify({"error": "Prefetch limit reached"}), 429
+
+        return jsonify({"status": status}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/samples/refresh", methods=["POST"])
+@token_required
+@admin_required
+def refresh_samples():
+    if sample_refresh_lock.locked():
+        return jsonify({"error": "Sample outputs are already being refreshed"}), 409
+
+    threading.Thread(
+        target=precompute_sample_outputs, kwargs={"force": True}, daemon=True
+    ).start()
+    return jsonify({"message": "Refreshing sample outputs"}), 202
+
+
 @app.route("/refactor_code", methods=["POST"])
 @token_required
 def refactor_code_api():
@@ -270,6 +945,8 @@ def refactor_code_api():
             refactored_code = refactor_code(code, language)
 
         return jsonify({"code": extract_code(refactored_code)})
+    except UpstreamCancelled as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -278,6 +955,10 @@ def refactor_code_api():
 @token_required
 def htmlcssjs_generate():
     data = request.get_json()
+    unknown = resolve_context(data, GENERATE_CONTEXT_FIELDS)
+    if unknown:
+        return unknown_context_response(unknown)
+
     project_description = data.get("prompt")
     code_type = data.get("type")
     html_content = (
@@ -309,14 +990,18 @@ def htmlcssjs_generate():
         )
 
         if code_type == "html":
-            return jsonify({"html": html_code})
+            return jsonify(remember_context({"html": html_code}))
         elif code_type == "css":
-            return jsonify({"css": css_code})
+            return jsonify(remember_context({"css": css_code}))
         elif code_type == "js":
-            return jsonify({"js": js_code})
+            return jsonify(remember_context({"js": js_code}))
         else:
             return jsonify({"error": "Invalid code type requested."}), 400
 
+    except UpstreamCancelled as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except OutputTruncated as e:
+        return jsonify({"error": str(e)}), 502
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
@@ -328,6 +1013,10 @@ def htmlcssjs_generate():
 def htmlcssjs_refactor():
     try:
         data = request.get_json()
+        unknown = resolve_context(data, REFACTOR_CONTEXT_FIELDS)
+        if unknown:
+            return unknown_context_response(unknown)
+
         html_content = data.get("html") if len(data.get("html", "")) > 0 else ""
         css_content = data.get("css") if len(data.get("css", "")) > 0 else ""
         js_content = data.get("js") if len(data.get("js", "")) > 0 else ""
@@ -354,7 +1043,7 @@ def htmlcssjs_refactor():
                 if html_content_refactored
                 else html_content
             )
-            return jsonify({"html": html_content_refactored})
+            return jsonify(remember_context({"html": html_content_refactored}))
 
         elif code_type == "css" and html_content and problem_description:
             if not html_content:
@@ -364,7 +1053,10 @@ def htmlcssjs_refactor():
                 )
             css_content_refactored = refactor_code_html_css_js(
                 refactor_css_prompt_user,
-                {"html_content": html_content, "css_content": css_content},
+                {
+                    "html_content": minify_html(html_content),
+                    "css_content": css_content,
+                },
                 problem_description,
             )
             css_content_refactored = re.search(
@@ -375,7 +1067,7 @@ def htmlcssjs_refactor():
                 if css_content_refactored
                 else css_content
             )
-            return jsonify({"css": css_content_refactored})
+            return jsonify(remember_context({"css": css_content_refactored}))
 
         elif code_type == "js" and html_content and css_content and problem_description:
             if not html_content or not css_content:
@@ -390,8 +1082,8 @@ def htmlcssjs_refactor():
             js_content_refactored = refactor_code_html_css_js(
                 refactor_js_prompt_user,
                 {
-                    "html_content": html_content,
-                    "css_content": css_content,
+                    "html_content": minify_html(html_content),
+                    "css_content": minify_css(css_content),
                     "js_content": js_content,
                 },
                 problem_description,
@@ -403,7 +1095,7 @@ def htmlcssjs_refactor():
                 js_content_refactored.group(1) if js_content_refactored else js_content
             )
 
-            return jsonify({"js": js_content_refactored})
+            return jsonify(remember_context({"js": js_content_refactored}))
 
         elif code_type == "html" and html_content:
             html_content_refactored = refactor_code_html_css_js(
@@ -417,7 +1109,7 @@ def htmlcssjs_refactor():
                 if html_content_refactored
                 else html_content
             )
-            return jsonify({"html": html_content_refactored})
+            return jsonify(remember_context({"html": html_content_refactored}))
 
         elif code_type == "css" and html_content:
             if not html_content:
@@ -427,7 +1119,10 @@ def htmlcssjs_refactor():
                 )
             css_content_refactored = refactor_code_html_css_js(
                 refactor_css_prompt,
-                {"html_content": html_content, "css_content": css_content},
+                {
+                    "html_content": minify_html(html_content),
+                    "css_content": css_content,
+                },
             )
             css_content_refactored = re.search(
                 CODE_REGEX, css_content_refactored, re.DOTALL
@@ -437,7 +1132,7 @@ def htmlcssjs_refactor():
                 if css_content_refactored
                 else css_content
             )
-            return jsonify({"css": css_content_refactored})
+            return jsonify(remember_context({"css": css_content_refactored}))
 
         elif code_type == "js" and html_content and css_content:
             if not html_content or not css_content:
@@ -452,8 +1147,8 @@ def htmlcssjs_refactor():
             js_content_refactored = refactor_code_html_css_js(
                 refactor_js_prompt,
                 {
-                    "html_content": html_content,
-                    "css_content": css_content,
+                    "html_content": minify_html(html_content),
+                    "css_content": minify_css(css_content),
                     "js_content": js_content,
                 },
             )
@@ -463,7 +1158,7 @@ def htmlcssjs_refactor():
             js_content_refactored = (
                 js_content_refactored.group(1) if js_content_refactored else js_content
             )
-            return jsonify({"js": js_content_refactored})
+            return jsonify(remember_context({"js": js_content_refactored}))
 
         else:
             return (
@@ -475,9 +1170,113 @@ def htmlcssjs_refactor():
                 400,
             )
 
+    except UpstreamCancelled as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except OutputTruncated as e:
+        return jsonify({"error": str(e)}), 502
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
+@app.route("/jobs", methods=["POST"])
+@token_required
+def submit_job():
+    data = request.get_json(silent=True) or {}
+    path = data.get("endpoint")
+    payload = data.get("payload")
+
+    if path not in JOB_ENDPOINTS:
+        return jsonify({"error": "Unsupported job endpoint"}), 400
+
+    if not isinstance(payload, dict):
+        return jsonify({"error": "'payload' must be an object"}), 400
+
+    try:
+        owner = request.user_data.get("userId")
+        request_key = hashlib.sha256(
+            json.dumps([owner, path, payload], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        job, created = job_store.submit(owner, path, request_key)
+        if created:
+            job_pool.submit(
+                run_job,
+                job["jobId"],
+                path,
+                payload,
+                {"Authorization": request.headers["Authorization"]},
+            )
+
+        return jsonify(job), 202
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+@token_required
+def get_job(job_id):
+    try:
+        wait = min(float(request.args.get("wait", 0)), MAX_JOB_WAIT)
+    except ValueError:
+        return jsonify({"error": "'wait' must be a number of seconds"}), 400
+
+    try:
+        # ?wait=N long-polls until the job finishes or N seconds pass.
+        owner = request.user_data.get("userId")
+        deadline = time.monotonic() + wait
+        job = job_store.get(job_id, owner)
+        while (
+            job is not None
+            and job["status"] in ("queued", "running")
+            and time.monotonic() < deadline
+        ):
+            time.sleep(JOB_POLL_INTERVAL)
+            job = job_store.get(job_id, owner)
+
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
+@app.route("/metrics/upstream", methods=["GET"])
+@token_required
+def upstream_metrics():
+    return (
+        jsonify(
+            {
+                "wasted": run_registry.waste(),
+                "profiles": profile_stats.snapshot(),
+                "retries": quota_gate.outcomes(),
+                "queues": upstream_scheduler.snapshot(),
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/metrics/usage", methods=["GET"])
+@token_required
+def usage_metrics():
+    try:
+        limit = min(int(request.args.get("limit", 10)), MAX_USAGE_REPORT)
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer"}), 400
+
+    if limit < 1:
+        return jsonify({"error": "'limit' must be positive"}), 400
+
+    try:
+        # Everyone else sees only their own usage.
+        return (
+            jsonify(usage_meter.report(request_user_id(), limit, everyone=is_admin())),
+            200,
+        )
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
 if __name__ == "__main__":
     app.run(debug=False, port=5002)
@@ -0,0 +1,117 @@
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# /dev/shm is tmpfs, so the cache lives in memory yet is still a file every
+# worker on the host can map, and it outlives any single worker.
+CACHE_PATH = os.getenv(
+    "GENAI_CACHE_PATH",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "genai-cache.db",
+    ),
+)
+CACHE_MAX_ENTRIES = int(os.getenv("GENAI_CACHE_MAX_ENTRIES", 10000))
+CACHE_MAX_VALUE_BYTES = int(os.getenv("GENAI_CACHE_MAX_VALUE_BYTES", 256 * 1024))
+CACHE_TTL = int(os.getenv("GENAI_CACHE_TTL", 24 * 60 * 60))
+CACHE_TOUCH_INTERVAL = 60
+
+
+class SharedCache:
+    # A SQLite table in WAL mode, memory-mapped by every worker. Inserts
+    # are single transactions, so readers never see a partial entry, and
+    # the least recently used entries are evicted past max_entries.
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries (expires_at)"
+            )
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1)
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("PRAGMA mmap_size=268435456")
+            self.local.connection = connection
+        return connection
+
+    @staticmethod
+    def key_for(*parts):
+        digest = hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        try:
+            row = self.connection().execute(
+                "SELECT value, last_used FROM entries WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+
+            # Recency only needs to be roughly right for eviction, so hits
+            # skip the write most of the time.
+            value, last_used = row
+            if now - last_used > CACHE_TOUCH_INTERVAL:
+                with self.connection() as connection:
+                    connection.execute(
+                        "UPDATE entries SET last_used = ? WHERE key = ?", (now, key)
+                    )
+            return value
+        except sqlite3.Error:
+            return None
+
+    def set(self, key, value, ttl=CACHE_TTL):
+        if ttl <= 0 or len(value) > CACHE_MAX_VALUE_BYTES:
+            return False
+
+        now = time.time()
+        try:
+            with self.connection() as connection:
+                connection.execute(
+                    """
+                    INSERT OR REPLACE INTO entries (key, value, expires_at, last_used)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (key, value, now + ttl, now),
+                )
+                connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+                connection.execute(
+                    """
+                    DELETE FROM entries WHERE key IN (
+                        SELECT key FROM entries ORDER BY last_used
+                        LIMIT max(0, (SELECT count(*) FROM entries) - ?)
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+            return True
+        except sqlite3.Error:
+            return False
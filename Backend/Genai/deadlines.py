@@ -0,0 +1,219 @@
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+import concurrent.futures
+from dotenv import load_dotenv
+from cache import CACHE_PATH
+
+load_dotenv()
+
+RUNS_PATH = os.getenv(
+    "GENAI_RUNS_PATH", os.path.join(os.path.dirname(CACHE_PATH), "genai-runs.db")
+)
+DEFAULT_DEADLINE = float(os.getenv("GENAI_DEFAULT_DEADLINE", 60))
+ENDPOINT_DEADLINES = {
+    "get_output_api": float(os.getenv("GENAI_OUTPUT_DEADLINE", 30)),
+    "prefetch_output": float(os.getenv("GENAI_OUTPUT_DEADLINE", 30)),
+    "generate_code": float(os.getenv("GENAI_GENERATE_DEADLINE", 60)),
+    "refactor_code_api": float(os.getenv("GENAI_REFACTOR_DEADLINE", 60)),
+    "htmlcssjs_generate": float(os.getenv("GENAI_PAGE_DEADLINE", 90)),
+    "htmlcssjs_refactor": float(os.getenv("GENAI_PAGE_DEADLINE", 90)),
+}
+CANCEL_POLL_INTERVAL = 0.1
+RUN_KEY_TTL = 24 * 60 * 60
+
+
+class UpstreamCancelled(Exception):
+    status_codes = {
+        "deadline": 504,
+        "disconnected": 499,
+        "superseded": 409,
+        "rate_limited": 503,
+        "unavailable": 503,
+        "over_budget": 429,
+    }
+    messages = {
+        "deadline": "The request took too long and was cancelled",
+        "disconnected": "The client disconnected",
+        "superseded": "Cancelled by a newer run from the same editor",
+        "rate_limited": "The model is over its rate limit, try again shortly",
+        "unavailable": "The model is unavailable, try again shortly",
+        "over_budget": "Token budget used up for today, try again later",
+    }
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(self.messages[reason])
+        self.reason = reason
+        self.status_code = self.status_codes[reason]
+        self.retry_after = retry_after
+
+
+class RunRegistry:
+    # Each user and editor pair has a generation number that every new run
+    # bumps. A run still waiting on the model when the number moves on has
+    # been superseded. Kept in SQLite so runs on different workers see each
+    # other; the same file tallies upstream time thrown away by
+    # cancellations.
+
+    def __init__(self, path=RUNS_PATH):
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_key TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_runs_updated_at ON runs (updated_at)"
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS spend (
+                    identity TEXT PRIMARY KEY,
+                    window_start REAL NOT NULL,
+                    used INTEGER NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS wasted (
+                    reason TEXT PRIMARY KEY,
+                    cancelled INTEGER NOT NULL,
+                    seconds REAL NOT NULL
+                )
+                """
+            )
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def claim(self, run_key):
+        now = time.time()
+        with self.connection() as connection:
+            connection.execute(
+                "DELETE FROM runs WHERE updated_at < ?", (now - RUN_KEY_TTL,)
+            )
+            return connection.execute(
+                """
+                INSERT INTO runs (run_key, generation, updated_at) VALUES (?, 1, ?)
+                ON CONFLICT (run_key) DO UPDATE SET
+                    generation = generation + 1,
+                    updated_at = excluded.updated_at
+                RETURNING generation
+                """,
+                (run_key, now),
+            ).fetchone()[0]
+
+    def current(self, run_key):
+        row = (
+            self.connection()
+            .execute("SELECT generation FROM runs WHERE run_key = ?", (run_key,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def charge(self, identity, limit, window):
+        # Fixed-window counter; returns False once identity is over limit.
+        now = time.time()
+        with self.connection() as connection:
+            used = connection.execute(
+                """
+                INSERT INTO spend (identity, window_start, used) VALUES (?, ?, 1)
+                ON CONFLICT (identity) DO UPDATE SET
+                    used = CASE WHEN window_start <= ? THEN 1 ELSE used + 1 END,
+                    window_start = CASE
+                        WHEN window_start <= ? THEN excluded.window_start
+                        ELSE window_start
+                    END
+                RETURNING used
+                """,
+                (identity, now, now - window, now - window),
+            ).fetchone()[0]
+        return used <= limit
+
+    def record_waste(self, reason, seconds):
+        with self.connection() as connection:
+            connection.execute(
+                """
+                INSERT INTO wasted (reason, cancelled, seconds) VALUES (?, 1, ?)
+                ON CONFLICT (reason) DO UPDATE SET
+                    cancelled = cancelled + 1,
+                    seconds = seconds + excluded.seconds
+                """,
+                (reason, seconds),
+            )
+
+    def waste(self):
+        rows = self.connection().execute("SELECT * FROM wasted").fetchall()
+        return {
+            reason: {"cancelled": cancelled, "seconds": round(seconds, 3)}
+            for reason, cancelled, seconds in rows
+        }
+
+
+upstream_loop = None
+upstream_loop_lock = threading.Lock()
+
+
+def get_upstream_loop():
+    # Upstream calls run on one shared event loop so that cancelling the
+    # task really aborts the HTTP request instead of abandoning a thread.
+    global upstream_loop
+    with upstream_loop_lock:
+        if upstream_loop is None:
+            upstream_loop = asyncio.new_event_loop()
+            threading.Thread(target=upstream_loop.run_forever, daemon=True).start()
+        return upstream_loop
+
+
+def client_disconnected(environ):
+    # A readable socket with nothing to read means the peer closed it.
+    sock = environ.get("gunicorn.socket") or environ.get("werkzeug.socket")
+    if sock is None:
+        return False
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (BlockingIOError, ValueError):
+        return False
+    except OSError:
+        return True
+
+
+def run_with_deadline(make_request, deadline, cancellation_reason, run_registry):
+    # make_request(timeout) returns the coroutine for the upstream call;
+    # the remaining budget is passed down as its HTTP timeout too.
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise UpstreamCancelled("deadline")
+
+    started = time.monotonic()
+    future = asyncio.run_coroutine_threadsafe(
+        make_request(remaining), get_upstream_loop()
+    )
+
+    while True:
+        done, _ = concurrent.futures.wait([future], timeout=CANCEL_POLL_INTERVAL)
+        if done:
+            return future.result()
+
+        reason = "deadline" if time.monotonic() >= deadline else cancellation_reason()
+        if reason:
+            future.cancel()
+            run_registry.record_waste(reason, time.monotonic() - started)
+            raise UpstreamCancelled(reason)
@@ -0,0 +1,340 @@
+import os
+import re
+import math
+import shutil
+import signal
+import hashlib
+import tempfile
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Off by default: /get-output needs no login, so running what it receives
+# is only safe inside the jail below. Without it C and C++ go to the model.
+EXEC_ENABLED = os.getenv("EXEC_ENABLED", "false").lower() == "true"
+EXEC_JAIL = os.getenv("EXEC_JAIL", "nsjail")
+EXEC_JAIL_UID = int(os.getenv("EXEC_JAIL_UID", 65534))
+EXEC_JAIL_GID = int(os.getenv("EXEC_JAIL_GID", 65534))
+EXEC_MAX_PROCESSES = int(os.getenv("EXEC_MAX_PROCESSES", 16))
+JAIL_READONLY_PATHS = ["/usr", "/lib", "/lib64", "/lib32", "/bin"]
+# Kafel policy: no debugging or reaching into other processes, no new
+# namespaces or mounts, and no sockets even if networking were left on.
+JAIL_SECCOMP_POLICY = (
+    "POLICY jail {"
+    " KILL { ptrace, process_vm_readv, process_vm_writev, mount, umount2,"
+    " pivot_root, chroot, unshare, setns, kexec_load, init_module,"
+    " finit_module, delete_module, bpf, perf_event_open, keyctl, add_key,"
+    " request_key, userfaultfd },"
+    " ERRNO(1) { socket, socketpair }"
+    " } USE jail DEFAULT ALLOW"
+)
+
+TOOLCHAINS = {
+    "c": (os.getenv("EXEC_CC", "gcc"), "main.c", ["-std=gnu17", "-O2", "-pipe"]),
+    "cpp": (
+        os.getenv("EXEC_CXX", "g++"),
+        "main.cpp",
+        ["-std=gnu++17", "-O2", "-pipe"],
+    ),
+}
+LINK_FLAGS = ["-lm"]
+
+EXEC_CACHE_DIR = os.getenv(
+    "EXEC_CACHE_DIR", os.path.join(tempfile.gettempdir(), "genai-exec-cache")
+)
+EXEC_CACHE_MAX_ENTRIES = int(os.getenv("EXEC_CACHE_MAX_ENTRIES", 512))
+EXEC_WORKERS = int(os.getenv("EXEC_WORKERS", os.cpu_count() or 2))
+EXEC_QUEUE_TIMEOUT = float(os.getenv("EXEC_QUEUE_TIMEOUT", 2))
+EXEC_COMPILE_TIMEOUT = float(os.getenv("EXEC_COMPILE_TIMEOUT", 20))
+EXEC_CPU_SECONDS = int(os.getenv("EXEC_CPU_SECONDS", 2))
+EXEC_WALL_SECONDS = float(os.getenv("EXEC_WALL_SECONDS", 5))
+EXEC_MEMORY_MB = int(os.getenv("EXEC_MEMORY_MB", 256))
+EXEC_COMPILE_MEMORY_MB = int(os.getenv("EXEC_COMPILE_MEMORY_MB", 1024))
+EXEC_MAX_OUTPUT = int(os.getenv("EXEC_MAX_OUTPUT", 64 * 1024))
+EXEC_MAX_BINARY = 64 * 1024 * 1024
+
+# Programs that read stdin need input the user never sent; leave those to
+# the model, which makes up plausible input.
+STDIN_REGEX = re.compile(
+    r"\b(scanf|getchar|fgets|gets|getline|fread|cin|read)\s*(\(|>>)"
+)
+
+SIGNAL_MESSAGES = {
+    signal.SIGSEGV: "Segmentation fault",
+    signal.SIGFPE: "Floating point exception",
+    signal.SIGABRT: "Aborted",
+    signal.SIGBUS: "Bus error",
+    signal.SIGILL: "Illegal instruction",
+}
+
+worker_slots = threading.BoundedSemaphore(EXEC_WORKERS)
+compile_locks = {}
+compile_locks_lock = threading.Lock()
+
+
+def jail_path():
+    return shutil.which(EXEC_JAIL)
+
+
+def toolchain_for(language):
+    if language not in TOOLCHAINS:
+        return None
+    compiler, source_name, flags = TOOLCHAINS[language]
+    compiler_path = shutil.which(compiler)
+    if compiler_path is None:
+        return None
+    return compiler_path, source_name, flags
+
+
+def cache_key(compiler_path, flags, code):
+    # The compiler's mtime stands in for its version, so an upgrade
+    # invalidates old binaries.
+    compiler = os.path.realpath(compiler_path)
+    digest = hashlib.sha256()
+    digest.update(f"{compiler}\0{os.stat(compiler).st_mtime_ns}\0".encode())
+    digest.update("\0".join(flags + LINK_FLAGS).encode())
+    digest.update(b"\0")
+    digest.update(code.encode("utf-8"))
+    return digest.hexdigest()
+
+
+@contextmanager
+def compile_lock(key):
+    # Entries are reference counted so the table only holds sources that
+    # are being compiled right now.
+    with compile_locks_lock:
+        entry = compile_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with compile_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del compile_locks[key]
+
+
+def evict_cache():
+    entries = [
+        entry for entry in os.scandir(EXEC_CACHE_DIR) if not entry.name.startswith(".")
+    ]
+    if len(entries) <= EXEC_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[: len(entries) - EXEC_CACHE_MAX_ENTRIES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def limit_output(file_size):
+    # Set on the jail process and inherited by the program; the jail keeps
+    # the current soft limit for RLIMIT_FSIZE (--rlimit_fsize soft).
+    def apply():
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    return apply
+
+
+def jail_command(args, timeout, cpu_seconds, memory_mb, binds, cwd):
+    # A fresh user, PID, mount, IPC, UTS and network namespace per call, a
+    # separate uid, only the toolchain directories mounted (read-only) plus
+    # the given binds, no /proc and no inherited environment.
+    command = [
+        jail_path(),
+        "--mode",
+        "o",
+        "--really_quiet",
+        "--user",
+        str(EXEC_JAIL_UID),
+        "--group",
+        str(EXEC_JAIL_GID),
+        "--hostname",
+        "jail",
+        "--disable_proc",
+        "--cwd",
+        cwd,
+        "--time_limit",
+        str(math.ceil(timeout)),
+        "--rlimit_cpu",
+        str(cpu_seconds),
+        "--rlimit_as",
+        str(memory_mb),
+        "--rlimit_fsize",
+        "soft",
+        "--rlimit_nproc",
+        str(EXEC_MAX_PROCESSES),
+        "--rlimit_nofile",
+        "64",
+        "--rlimit_core",
+        "0",
+        "--seccomp_string",
+        JAIL_SECCOMP_POLICY,
+        "--env",
+        "PATH=/usr/bin:/bin",
+        "--env",
+        "LANG=C.UTF-8",
+        "--tmpfsmount",
+        "/tmp",
+    ]
+    for path in JAIL_READONLY_PATHS:
+        if os.path.isdir(path):
+            command += ["--bindmount_ro", path]
+    for option, source, target in binds:
+        command += [option, f"{source}:{target}"]
+    return command + ["--", *args]
+
+
+def run_limited(
+    args,
+    binds,
+    cwd,
+    timeout,
+    cpu_seconds,
+    memory_mb,
+    file_size=EXEC_MAX_OUTPUT,
+    stdin_data="",
+):
+    # stdout and stderr go to a file capped by RLIMIT_FSIZE, so a runaway
+    # program is stopped by the kernel instead of filling our memory.
+    with tempfile.TemporaryFile() as output:
+        process = subprocess.Popen(
+            jail_command(args, timeout, cpu_seconds, memory_mb, binds, cwd),
+            stdin=subprocess.PIPE,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            env={},
+            preexec_fn=limit_output(file_size),
+            start_new_session=True,
+        )
+        timed_out = False
+        try:
+            # The jail enforces the time limit; this is only a backstop.
+            process.communicate(
+                stdin_data.encode("utf-8"), timeout=math.ceil(timeout) + 1
+            )
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+
+        output.seek(0)
+        text = output.read(EXEC_MAX_OUTPUT).decode("utf-8", errors="replace")
+
+    # nsjail exits with 128 plus the signal that killed the program; turn
+    # that back into Popen's negative return code. The jail kills with
+    # SIGKILL when --time_limit runs out, and so does the kernel at the CPU
+    # limit, since nsjail sets the hard limit to the soft one.
+    returncode = process.returncode
+    if returncode is not None and returncode > 128:
+        returncode = 128 - returncode
+    if returncode == -signal.SIGKILL:
+        timed_out = True
+    return returncode, text, timed_out
+
+
+def compile_program(code, language):
+    compiler_path, source_name, flags = toolchain_for(language)
+    key = cache_key(compiler_path, flags, code)
+    binary_path = os.path.join(EXEC_CACHE_DIR, key)
+    errors_path = f"{binary_path}.err"
+
+    with compile_lock(key):
+        # Touching a hit keeps it at the young end of the eviction order.
+        if os.path.exists(binary_path):
+            os.utime(binary_path)
+            return binary_path, None
+        if os.path.exists(errors_path):
+            os.utime(errors_path)
+            with open(errors_path) as errors:
+                return None, errors.read()
+
+        os.makedirs(EXEC_CACHE_DIR, exist_ok=True)
+        with tempfile.TemporaryDirectory() as workdir:
+            with open(os.path.join(workdir, source_name), "w") as source:
+                source.write(code)
+            # The jail's uid has to be able to write the binary.
+            os.chmod(workdir, 0o777)
+
+            returncode, text, timed_out = run_limited(
+                [compiler_path, *flags, source_name, "-o", "program", *LINK_FLAGS],
+                [("--bindmount", workdir, "/work")],
+                "/work",
+                EXEC_COMPILE_TIMEOUT,
+                int(EXEC_COMPILE_TIMEOUT),
+                EXEC_COMPILE_MEMORY_MB,
+                EXEC_MAX_BINARY,
+            )
+
+            # Write to a dotfile first so other workers never see a
+            # half-written cache entry.
+            staging_path = os.path.join(EXEC_CACHE_DIR, f".{key}.{os.getpid()}")
+            if returncode == 0:
+                shutil.copy2(os.path.join(workdir, "program"), staging_path)
+                os.replace(staging_path, binary_path)
+                evict_cache()
+                return binary_path, None
+
+        if timed_out:
+            # Not cached: a slow compile may succeed on a quieter machine.
+            return None, "Compilation timed out"
+
+        with open(staging_path, "w") as errors:
+            errors.write(text)
+        os.replace(staging_path, errors_path)
+        evict_cache()
+        return None, text
+
+
+def run_program(binary_path, stdin_data):
+    # Only the binary is mounted; the program can write nowhere but /tmp.
+    os.chmod(binary_path, 0o755)
+    returncode, text, timed_out = run_limited(
+        ["/work/program"],
+        [("--bindmount_ro", binary_path, "/work/program")],
+        "/tmp",
+        EXEC_WALL_SECONDS,
+        EXEC_CPU_SECONDS,
+        EXEC_MEMORY_MB,
+        stdin_data=stdin_data,
+    )
+
+    if timed_out or returncode == -signal.SIGXCPU:
+        return f"{text}...\nTime limit exceeded" if text else "Time limit exceeded"
+    if returncode == -signal.SIGXFSZ:
+        return f"{text}..."
+    if returncode is not None and -returncode in SIGNAL_MESSAGES:
+        return f"{text}{SIGNAL_MESSAGES[-returncode]}"
+    return text
+
+
+def execute_code(code, language, stdin_data=None):
+    # Returns the program's output, or None when it should go to the model
+    # instead: execution disabled or no jail, no toolchain, the program
+    # wants input, or every worker slot is busy.
+    if not EXEC_ENABLED or jail_path() is None:
+        return None
+    if toolchain_for(language) is None:
+        return None
+    if stdin_data is None and STDIN_REGEX.search(code):
+        return None
+    if not worker_slots.acquire(timeout=EXEC_QUEUE_TIMEOUT):
+        return None
+
+    try:
+        binary_path, errors = compile_program(code, language)
+        if binary_path is None:
+            return errors
+        return run_program(binary_path, stdin_data or "")
+    finally:
+        worker_slots.release()
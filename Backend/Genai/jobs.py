@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import sqlite3
+import secrets
+import threading
+from dotenv import load_dotenv
+from cache import CACHE_PATH
+
+load_dotenv()
+
+JOBS_PATH = os.getenv(
+    "GENAI_JOBS_PATH", os.path.join(os.path.dirname(CACHE_PATH), "genai-jobs.db")
+)
+JOB_WORKERS = int(os.getenv("GENAI_JOB_WORKERS", 4))
+JOB_RESULT_TTL = int(os.getenv("GENAI_JOB_RESULT_TTL", 10 * 60))
+
+
+class JobStore:
+    # Job state lives in a SQLite file next to the response cache, so any
+    # worker on the host can answer a poll for a job another worker runs.
+
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    endpoint TEXT NOT NULL,
+                    request_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    status_code INTEGER,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_request_key ON jobs (request_key)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_expires_at ON jobs (expires_at)"
+            )
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    @staticmethod
+    def to_dict(row):
+        job = {
+            "jobId": row["job_id"],
+            "endpoint": row["endpoint"],
+            "status": row["status"],
+        }
+        if row["status_code"] is not None:
+            job["statusCode"] = row["status_code"]
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def submit(self, owner, endpoint, request_key):
+        # Resubmitting a request that is still queued, running or finished
+        # within the TTL returns the existing job instead of starting a new
+        # generation, so a client that lost its job ID can pick it up again.
+        now = time.time()
+        with self.connection() as connection:
+            connection.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
+            row = connection.execute(
+                """
+                SELECT * FROM jobs
+                WHERE request_key = ? AND status != 'failed' AND expires_at > ?
+                ORDER BY created_at DESC
+                LIMIT 1
+                """,
+                (request_key, now),
+            ).fetchone()
+            if row is not None:
+                return self.to_dict(row), False
+
+            job_id = secrets.token_urlsafe(16)
+            connection.execute(
+                """
+                INSERT INTO jobs (
+                    job_id, owner, endpoint, request_key, status,
+                    created_at, expires_at
+                )
+                VALUES (?, ?, ?, ?, 'queued', ?, ?)
+                """,
+                (job_id, owner, endpoint, request_key, now, now + JOB_RESULT_TTL),
+            )
+            return {"jobId": job_id, "endpoint": endpoint, "status": "queued"}, True
+
+    def start(self, job_id):
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'running' WHERE job_id = ?", (job_id,)
+            )
+
+    def finish(self, job_id, status_code, result):
+        now = time.time()
+        with self.connection() as connection:
+            connection.execute(
+                """
+                UPDATE jobs
+                SET status = ?, status_code = ?, result = ?, expires_at = ?
+                WHERE job_id = ?
+                """,
+                (
+                    "succeeded" if status_code < 400 else "failed",
+                    status_code,
+                    json.dumps(result),
+                    now + JOB_RESULT_TTL,
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id, owner):
+        row = (
+            self.connection()
+            .execute(
+                "SELECT * FROM jobs WHERE job_id = ? AND owner IS ? AND expires_at > ?",
+                (job_id, owner, time.time()),
+            )
+            .fetchone()
+        )
+        return self.to_dict(row) if row is not None else None
@@ -0,0 +1,152 @@
+import os
+import re
+from html import escape
+from html.parser import HTMLParser
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "minify" strips comments and collapses whitespace; "structure" also
+# reduces the HTML handed to CSS and JS generation to its tags, ids,
+# classes and the few attributes scripts hook into.
+HTML_CONTEXT_MODE = os.getenv("GENAI_HTML_CONTEXT_MODE", "minify").lower()
+
+VERBATIM_TAGS = {"pre", "textarea", "script", "style"}
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+STRUCTURE_ATTRIBUTES = {"id", "class", "name", "type", "for", "href", "src"}
+STRUCTURE_TEXT_LIMIT = 40
+
+CSS_TOKEN_REGEX = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|\s*([{};,])\s*|(\s+)""",
+    re.DOTALL,
+)
+
+
+def minify_css(css):
+    # Strings are copied untouched; comments go and whitespace collapses.
+    def replace(match):
+        string, comment, punctuation, whitespace = match.groups()
+        if string:
+            return string
+        if comment:
+            return ""
+        if punctuation:
+            return punctuation
+        return " "
+
+    return CSS_TOKEN_REGEX.sub(replace, css).strip()
+
+
+class HTMLMinifier(HTMLParser):
+    # Re-emits the document from the parser's events. Start tags are copied
+    # exactly as written, and the contents of <pre>, <textarea> and inline
+    # scripts are never touched.
+
+    def __init__(self, structure_only=False):
+        super().__init__(convert_charrefs=False)
+        self.structure_only = structure_only
+        self.parts = []
+        self.verbatim = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.structure_only:
+            if tag in ("script", "style"):
+                self.verbatim.append(tag)
+                return
+            kept = "".join(
+                f" {name}" if value is None else f' {name}="{escape(value)}"'
+                for name, value in attrs
+                if name in STRUCTURE_ATTRIBUTES or name.startswith(("data-", "on"))
+            )
+            self.parts.append(f"<{tag}{kept}>")
+        else:
+            self.parts.append(self.get_starttag_text())
+        if tag in VERBATIM_TAGS:
+            self.verbatim.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in VERBATIM_TAGS and self.verbatim and self.verbatim[-1] == tag:
+            self.verbatim.pop()
+
+    def handle_endtag(self, tag):
+        if self.verbatim and self.verbatim[-1] == tag:
+            self.verbatim.pop()
+            if self.structure_only and tag in ("script", "style"):
+                return
+        if tag not in VOID_TAGS:
+            self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.verbatim:
+            if self.structure_only and self.verbatim[-1] in ("script", "style"):
+                return
+            if self.verbatim[-1] == "style":
+                data = minify_css(data)
+            self.parts.append(data)
+            return
+
+        text = re.sub(r"\s+", " ", data)
+        if self.structure_only:
+            text = text.strip()
+            if len(text) > STRUCTURE_TEXT_LIMIT:
+                text = text[:STRUCTURE_TEXT_LIMIT] + "..."
+            if text:
+                self.parts.append(text)
+            return
+
+        # Whitespace between inline elements and entities is part of the
+        # text ("<b>x</b> <i>y</i>"), so a run collapses to one space but
+        # is never dropped.
+        if text == " " and self.parts and self.parts[-1].endswith(" "):
+            return
+        self.parts.append(text)
+
+    def handle_entityref(self, name):
+        self.parts.append(f"&{name};")
+
+    def handle_charref(self, name):
+        self.parts.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        if self.verbatim:
+            self.parts.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        if not self.structure_only:
+            self.parts.append(f"<!{decl}>")
+
+    def unknown_decl(self, data):
+        self.parts.append(f"<![{data}]>")
+
+    def minify(self, html):
+        self.feed(html)
+        self.close()
+        return "".join(self.parts).strip()
+
+
+def minify_html(html):
+    if not html:
+        return html
+    return HTMLMinifier().minify(html)
+
+
+def html_context(html):
+    # HTML that only serves as context for generating CSS or JS.
+    if not html:
+        return html
+    return HTMLMinifier(structure_only=HTML_CONTEXT_MODE == "structure").minify(html)
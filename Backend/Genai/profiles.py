@@ -0,0 +1,104 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_PATH = os.getenv(
+    "GENAI_PROFILES_PATH", os.path.join(BASE_DIR, "generation_profiles.json")
+)
+TRUNCATION_MARKER = "\n... [output truncated]"
+
+
+class OutputTruncated(Exception):
+    # Raised for profiles with "reject_truncated" when the model stops at
+    # max_output_tokens: a page cut off mid-way has no closing fence to
+    # extract, so an answer would come back empty.
+
+    def __init__(self):
+        super().__init__(
+            "The generated code was cut off before it finished, try a smaller request"
+        )
+
+
+def load_profiles(path=PROFILES_PATH):
+    with open(path) as profiles:
+        return json.load(profiles)
+
+
+def resolve_profile(profiles, name, language=None):
+    # "default" < "<name>" < "<name>:<language>", later entries winning.
+    profile = dict(profiles.get("default", {}))
+    profile.update(profiles.get(name, {}))
+    if language:
+        profile.update(profiles.get(f"{name}:{language}", {}))
+    return profile
+
+
+def generation_config(profile):
+    config = {
+        key: profile[key]
+        for key in ("max_output_tokens", "temperature", "top_p", "stop_sequences")
+        if profile.get(key) is not None
+    }
+    if profile.get("thinking_budget") is not None:
+        config["thinking_config"] = {"thinking_budget": profile["thinking_budget"]}
+    return config
+
+
+def hit_token_limit(response):
+    candidates = getattr(response, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return getattr(reason, "name", reason) == "MAX_TOKENS"
+
+
+def truncate_output(text, profile, stopped_at_limit=False):
+    # Output is cut either here, at max_output_chars, or by the model at
+    # max_output_tokens, which usually comes first. Profiles with a
+    # character cap get the marker in both cases.
+    limit = profile.get("max_output_chars")
+    text = text or ""
+    if limit and len(text) > limit:
+        return text[:limit] + TRUNCATION_MARKER, True
+    if stopped_at_limit:
+        return (text + TRUNCATION_MARKER if limit else text), True
+    return text, False
+
+
+class ProfileStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = {}
+
+    def record(self, profile, elapsed, chars, truncated):
+        with self.lock:
+            stats = self.profiles.setdefault(
+                profile,
+                {
+                    "calls": 0,
+                    "truncated": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "total_chars": 0,
+                    "max_chars": 0,
+                },
+            )
+            stats["calls"] += 1
+            stats["truncated"] += truncated
+            stats["total_ms"] += elapsed * 1000
+            stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+            stats["total_chars"] += chars
+            stats["max_chars"] = max(stats["max_chars"], chars)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                profile: {
+                    **stats,
+                    "avg_ms": stats["total_ms"] / stats["calls"],
+                    "avg_chars": stats["total_chars"] / stats["calls"],
+                }
+                for profile, stats in self.profiles.items()
+            }
@@ -0,0 +1,227 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+from deadlines import (
+    RUNS_PATH,
+    CANCEL_POLL_INTERVAL,
+    UpstreamCancelled,
+    run_with_deadline,
+)
+
+load_dotenv()
+
+RETRY_ATTEMPTS = int(os.getenv("GENAI_RETRY_ATTEMPTS", 4))
+RETRY_BASE_DELAY = float(os.getenv("GENAI_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("GENAI_RETRY_MAX_DELAY", 8))
+QUOTA_PAUSE = float(os.getenv("GENAI_QUOTA_PAUSE", 30))
+MAX_QUOTA_PAUSE = 10 * 60
+
+RATE_LIMITED_CODES = {429}
+UNAVAILABLE_CODES = {408, 500, 502, 503, 504}
+
+
+class QuotaGate:
+    # Once the model answers 429, every worker holds its calls until the
+    # pause is over instead of each finding out with a request of its own.
+    # Shares the runs file with RunRegistry and also counts retry outcomes.
+
+    def __init__(self, path=RUNS_PATH):
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS quota_pauses (
+                    scope TEXT PRIMARY KEY,
+                    resume_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS retry_outcomes (
+                    outcome TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL
+                )
+                """
+            )
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def pause(self, scope, seconds):
+        with self.connection() as connection:
+            connection.execute(
+                """
+                INSERT INTO quota_pauses (scope, resume_at) VALUES (?, ?)
+                ON CONFLICT (scope) DO UPDATE SET
+                    resume_at = max(resume_at, excluded.resume_at)
+                """,
+                (scope, time.time() + seconds),
+            )
+
+    def paused_for(self, scope):
+        row = (
+            self.connection()
+            .execute("SELECT resume_at FROM quota_pauses WHERE scope = ?", (scope,))
+            .fetchone()
+        )
+        return max(0, row[0] - time.time()) if row else 0
+
+    def record(self, outcome):
+        with self.connection() as connection:
+            connection.execute(
+                """
+                INSERT INTO retry_outcomes (outcome, count) VALUES (?, 1)
+                ON CONFLICT (outcome) DO UPDATE SET count = count + 1
+                """,
+                (outcome,),
+            )
+
+    def outcomes(self):
+        return dict(
+            self.connection().execute("SELECT * FROM retry_outcomes").fetchall()
+        )
+
+
+def parse_retry_after(value):
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(error):
+    # The Retry-After header if the response has one, else the RetryInfo
+    # detail Gemini puts in the body of a 429 ("retryDelay": "37s").
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers and headers.get("retry-after"):
+        delay = parse_retry_after(headers.get("retry-after"))
+        if delay is not None:
+            return delay
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []):
+            if str(detail.get("@type", "")).endswith("RetryInfo"):
+                delay = parse_retry_after(str(detail.get("retryDelay", "")).rstrip("s"))
+                if delay is not None:
+                    return delay
+    return None
+
+
+def classify_error(error):
+    # Returns "rate_limited", "unavailable" or None for errors not worth
+    # retrying. httpx is only imported here, after the SDK has loaded it.
+    import httpx
+
+    code = getattr(error, "code", None)
+    if code in RATE_LIMITED_CODES:
+        return "rate_limited"
+    if code in UNAVAILABLE_CODES:
+        return "unavailable"
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError)):
+        return "unavailable"
+    return None
+
+
+def backoff_delay(attempt):
+    # Full jitter, so clients that failed together do not retry together.
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
+def sleep_until(wake_at, cancellation_reason):
+    while True:
+        remaining = wake_at - time.monotonic()
+        if remaining <= 0:
+            return
+        reason = cancellation_reason()
+        if reason:
+            raise UpstreamCancelled(reason)
+        time.sleep(min(remaining, CANCEL_POLL_INTERVAL))
+
+
+def wait_for_quota(quota_gate, scope, deadline, cancellation_reason):
+    paused_for = quota_gate.paused_for(scope)
+    if paused_for <= 0:
+        return
+    if time.monotonic() + paused_for >= deadline:
+        quota_gate.record("rejected_paused")
+        raise UpstreamCancelled("rate_limited", retry_after=paused_for)
+
+    # Spread the restart a little so paused calls do not all fire at once.
+    quota_gate.record("waited_paused")
+    sleep_until(
+        time.monotonic() + paused_for + random.uniform(0, RETRY_BASE_DELAY),
+        cancellation_reason,
+    )
+
+
+def call_with_retries(
+    make_request,
+    deadline,
+    cancellation_reason,
+    run_registry,
+    quota_gate,
+    scope,
+    slot=nullcontext,
+):
+    # run_with_deadline plus retries of rate-limit and availability errors,
+    # as long as the wait still fits in the request's deadline. Gives up
+    # with an UpstreamCancelled carrying the suggested Retry-After. slot()
+    # is held for each attempt, not across the backoff between them.
+    attempt = 0
+    while True:
+        wait_for_quota(quota_gate, scope, deadline, cancellation_reason)
+        try:
+            with slot():
+                response = run_with_deadline(
+                    make_request, deadline, cancellation_reason, run_registry
+                )
+            if attempt:
+                quota_gate.record("recovered")
+            return response
+        except UpstreamCancelled:
+            raise
+        except Exception as error:
+            kind = classify_error(error)
+            if kind is None:
+                raise
+
+            quota_gate.record(kind)
+            delay = retry_delay(error)
+            if kind == "rate_limited":
+                if delay is None:
+                    delay = QUOTA_PAUSE
+                quota_gate.pause(scope, min(MAX_QUOTA_PAUSE, delay))
+                # The pause is honoured by wait_for_quota on the next pass.
+                delay = 0
+            elif delay is None:
+                delay = backoff_delay(attempt)
+
+            attempt += 1
+            if attempt >= RETRY_ATTEMPTS:
+                quota_gate.record("exhausted")
+                raise UpstreamCancelled(
+                    kind, retry_after=quota_gate.paused_for(scope) or delay
+                ) from error
+            if time.monotonic() + delay >= deadline:
+                quota_gate.record("out_of_time")
+                raise UpstreamCancelled(kind, retry_after=delay) from error
+            sleep_until(time.monotonic() + delay, cancellation_reason)
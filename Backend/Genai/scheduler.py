@@ -0,0 +1,224 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from deadlines import CANCEL_POLL_INTERVAL, UpstreamCancelled
+
+load_dotenv()
+
+UPSTREAM_CONCURRENCY = int(os.getenv("GENAI_UPSTREAM_CONCURRENCY", 8))
+SIGNED_IN_WEIGHT = float(os.getenv("GENAI_SIGNED_IN_WEIGHT", 2))
+ANONYMOUS_WEIGHT = float(os.getenv("GENAI_ANONYMOUS_WEIGHT", 1))
+# A waiter climbs one class for every AGING_INTERVAL it has waited, so a
+# steady stream of runs cannot starve page generation forever.
+AGING_INTERVAL = float(os.getenv("GENAI_QUEUE_AGING_INTERVAL", 5))
+# Less time left than this and the call is dropped rather than started.
+MIN_USEFUL_TIME = float(os.getenv("GENAI_QUEUE_MIN_USEFUL_TIME", 1))
+MAX_USER_TAGS = 10000
+
+# Highest priority first.
+PRIORITY_CLASSES = ("interactive", "generate", "page", "batch")
+ENDPOINT_PRIORITIES = {
+    "get_output_api": "interactive",
+    "generate_code": "generate",
+    "refactor_code_api": "generate",
+    "htmlcssjs_generate": "page",
+    "htmlcssjs_refactor": "page",
+    "prefetch_output": "batch",
+}
+
+
+def ranked(priority):
+    return PRIORITY_CLASSES.index(priority)
+
+
+class Waiter:
+    def __init__(self, priority, user, weight, deadline):
+        self.priority = priority
+        self.user = user
+        self.weight = weight
+        self.deadline = deadline
+        self.tag = 0.0
+        self.enqueued_at = time.monotonic()
+        self.state = "waiting"
+
+
+class UpstreamScheduler:
+    # Hands out this worker's upstream slots. Classes are served in
+    # priority order; inside a class, users share slots by weight through
+    # start-time fair queueing, so one user's burst of page generations
+    # queues behind itself and not in front of everyone else.
+
+    def __init__(self, slots=UPSTREAM_CONCURRENCY):
+        self.condition = threading.Condition()
+        self.free = slots
+        self.queues = {priority: [] for priority in PRIORITY_CLASSES}
+        self.virtual_time = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self.user_tags = {}
+        self.sequence = itertools.count()
+        # Calls queued under a key, and keys promoted to a higher class.
+        self.keyed_waiters = {}
+        self.promotions = {}
+        self.stats = {
+            priority: {
+                "granted": 0,
+                "dropped": 0,
+                "cancelled": 0,
+                "promoted": 0,
+                "total_wait_ms": 0.0,
+                "max_wait_ms": 0.0,
+            }
+            for priority in PRIORITY_CLASSES
+        }
+
+    def push(self, waiter):
+        key = (waiter.priority, waiter.user)
+        waiter.tag = max(
+            self.virtual_time[waiter.priority], self.user_tags.get(key, 0.0)
+        )
+        self.user_tags[key] = waiter.tag + 1 / waiter.weight
+        if len(self.user_tags) > MAX_USER_TAGS:
+            self.user_tags = {
+                key: last
+                for key, last in self.user_tags.items()
+                if last > self.virtual_time[key[0]]
+            }
+
+        heapq.heappush(
+            self.queues[waiter.priority], (waiter.tag, next(self.sequence), waiter)
+        )
+
+    def next_waiter(self, now):
+        # Head of each class, ranked by class after aging. Entries left
+        # behind by a promotion are skipped like finished ones.
+        best = None
+        for rank, priority in enumerate(PRIORITY_CLASSES):
+            queue = self.queues[priority]
+            while queue and (
+                queue[0][2].state != "waiting" or queue[0][2].priority != priority
+            ):
+                heapq.heappop(queue)
+            if not queue:
+                continue
+            waiter = queue[0][2]
+            aged_rank = rank - int((now - waiter.enqueued_at) / AGING_INTERVAL)
+            if best is None or aged_rank < best[0]:
+                best = (aged_rank, priority)
+        return heapq.heappop(self.queues[best[1]])[2] if best else None
+
+    def promote(self, key, priority):
+        # Moves the call queued under key, and any retry of it, up to
+        # priority, e.g. a prefetch that an interactive Run now waits on.
+        with self.condition:
+            current = self.promotions.get(key)
+            if current is None or ranked(priority) < ranked(current):
+                self.promotions[key] = priority
+
+            waiter = self.keyed_waiters.get(key)
+            if (
+                waiter is None
+                or waiter.state != "waiting"
+                or ranked(priority) >= ranked(waiter.priority)
+            ):
+                return
+            self.stats[waiter.priority]["promoted"] += 1
+            waiter.priority = priority
+            self.push(waiter)
+            self.dispatch()
+
+    def forget(self, key):
+        with self.condition:
+            self.promotions.pop(key, None)
+
+    def dispatch(self):
+        now = time.monotonic()
+        while self.free > 0:
+            waiter = self.next_waiter(now)
+            if waiter is None:
+                break
+
+            stats = self.stats[waiter.priority]
+            if waiter.deadline - now < MIN_USEFUL_TIME:
+                waiter.state = "dropped"
+                stats["dropped"] += 1
+                continue
+
+            waiter.state = "granted"
+            self.free -= 1
+            self.virtual_time[waiter.priority] = waiter.tag
+            waited_ms = (now - waiter.enqueued_at) * 1000
+            stats["granted"] += 1
+            stats["total_wait_ms"] += waited_ms
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], waited_ms)
+        self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority, user, weight, deadline, cancellation_reason, key=None):
+        with self.condition:
+            promoted = self.promotions.get(key)
+            if promoted is not None and ranked(promoted) < ranked(priority):
+                priority = promoted
+            waiter = Waiter(priority, user, weight, deadline)
+            self.push(waiter)
+            if key is not None:
+                self.keyed_waiters[key] = waiter
+            self.dispatch()
+
+        try:
+            # cancellation_reason() can read SQLite, so it is checked with
+            # the lock released; a grant that lands meanwhile is kept and
+            # the call is stopped by run_with_deadline instead.
+            while True:
+                with self.condition:
+                    if waiter.state == "waiting":
+                        self.condition.wait(CANCEL_POLL_INTERVAL)
+                    if waiter.state != "waiting":
+                        break
+
+                reason = (
+                    "deadline"
+                    if time.monotonic() >= deadline
+                    else cancellation_reason()
+                )
+                if reason:
+                    with self.condition:
+                        if waiter.state == "waiting":
+                            waiter.state = "cancelled"
+                            self.stats[waiter.priority]["cancelled"] += 1
+                            raise UpstreamCancelled(reason)
+        finally:
+            if key is not None:
+                with self.condition:
+                    if self.keyed_waiters.get(key) is waiter:
+                        del self.keyed_waiters[key]
+
+        if waiter.state == "dropped":
+            raise UpstreamCancelled("deadline")
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.free += 1
+                self.dispatch()
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                priority: {
+                    **stats,
+                    "queued": sum(
+                        waiter.state == "waiting" and waiter.priority == priority
+                        for _, _, waiter in self.queues[priority]
+                    ),
+                    "avg_wait_ms": (
+                        stats["total_wait_ms"] / stats["granted"]
+                        if stats["granted"]
+                        else 0.0
+                    ),
+                }
+                for priority, stats in self.stats.items()
+            }
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py reads its settings at import; keep its SQLite files out of /dev/shm
+# and its deadlines and backoff short enough for a test run.
+os.environ["JWT_SECRET"] = "test-secret-" + "x" * 20
+os.environ["GENAI_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "genai-cache.db")
+os.environ["SAMPLE_OUTPUTS_PATH"] = os.path.join(tempfile.mkdtemp(), "samples.json")
+os.environ["GEMINI_API_KEY"] = "test-key"
+os.environ["GEMINI_MODEL"] = "gemini-test"
+os.environ["GENAI_GENERATE_DEADLINE"] = "10"
+os.environ["GENAI_QUOTA_PAUSE"] = "30"
+os.environ["GENAI_RETRY_BASE_DELAY"] = "0.05"
+
+RETRY_INFO = {
+    "@type": "type.googleapis.com/google.rpc.RetryInfo",
+    "retryDelay": "1s",
+}
+ERRORS = {
+    "rate_limited": (429, "RESOURCE_EXHAUSTED", [RETRY_INFO]),
+    "quota_exhausted": (429, "RESOURCE_EXHAUSTED", []),
+    "unavailable": (503, "UNAVAILABLE", []),
+    "bad_request": (400, "INVALID_ARGUMENT", []),
+}
+
+
+class GeminiStub(ThreadingHTTPServer):
+    # Answers generateContent with the next queued fault, or a canned
+    # candidate once the queue is empty, after waiting delay seconds.
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), GeminiHandler)
+        self.faults = []
+        self.requests = 0
+        self.delay = 0
+
+
+class GeminiHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        fault = self.server.faults.pop(0) if self.server.faults else None
+        if fault in (None, "max_tokens"):
+            # max_tokens: the model ran out of output tokens mid-answer.
+            code = 200
+            text = "```python\nprint(1)\n```" if fault is None else "```html\n<div>"
+            body = {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [{"text": text}]},
+                        "finishReason": "STOP" if fault is None else "MAX_TOKENS",
+                    }
+                ]
+            }
+        else:
+            code, status, details = ERRORS[fault]
+            body = {
+                "error": {
+                    "code": code,
+                    "status": status,
+                    "message": fault,
+                    "details": details,
+                }
+            }
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope="session")
+def gemini_stub():
+    stub = GeminiStub()
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{stub.server_port}"
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+
+@pytest.fixture
+def gemini(gemini_stub):
+    import app
+
+    gemini_stub.faults.clear()
+    gemini_stub.requests = 0
+    gemini_stub.delay = 0
+    # A 429 pauses the model for every later call; start each test unpaused.
+    with app.quota_gate.connection() as connection:
+        connection.execute("DELETE FROM quota_pauses")
+    return gemini_stub
+
+
+@pytest.fixture
+def client(gemini):
+    import app
+
+    return app.app.test_client()
@@ -0,0 +1,59 @@
+import os
+import sys
+import signal
+import resource
+import subprocess
+
+# Stands in for nsjail in tests: no namespaces, but the same binds (by
+# rewriting paths), rlimits (soft and hard alike), --time_limit and exit
+# status. Like nsjail it
+# kills the program with SIGKILL when the time limit runs out and exits
+# with 128 plus the signal that killed it.
+
+FLAGS = {"--really_quiet", "--disable_proc"}
+
+
+def main(argv):
+    options = []
+    while argv[0] != "--":
+        if argv[0] in FLAGS:
+            options.append((argv[0], None))
+            argv = argv[1:]
+        else:
+            options.append((argv[0], argv[1]))
+            argv = argv[2:]
+    args = argv[1:]
+
+    settings = dict(options)
+    binds = {}
+    for option, value in options:
+        if option in ("--bindmount", "--bindmount_ro"):
+            source, _, target = value.partition(":")
+            binds[target or source] = source
+    args = [binds.get(arg, arg) for arg in args]
+    cwd = binds.get(settings["--cwd"], settings["--cwd"])
+    if cwd == "/tmp":
+        cwd = os.getcwd()
+
+    def limits():
+        cpu = int(settings["--rlimit_cpu"])
+        memory = int(settings["--rlimit_as"]) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+    env = dict(
+        value.split("=", 1) for option, value in options if option == "--env"
+    )
+    process = subprocess.Popen(args, cwd=cwd, env=env, preexec_fn=limits)
+    try:
+        process.wait(timeout=int(settings["--time_limit"]))
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    if process.returncode < 0:
+        return 128 - process.returncode
+    return process.returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+import executor
+
+
+@pytest.fixture
+def jail(tmp_path, monkeypatch):
+    shim = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nsjail_shim.py")
+    path = tmp_path / "nsjail"
+    path.write_text(f'#!/bin/sh\nexec {sys.executable} {shim} "$@"\n')
+    path.chmod(0o755)
+    monkeypatch.setattr(executor, "EXEC_ENABLED", True)
+    monkeypatch.setattr(executor, "EXEC_JAIL", str(path))
+    monkeypatch.setattr(executor, "EXEC_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(executor, "EXEC_CPU_SECONDS", 1)
+    monkeypatch.setattr(executor, "EXEC_WALL_SECONDS", 2)
+    monkeypatch.setattr(executor, "EXEC_MAX_OUTPUT", 4096)
+    if executor.toolchain_for("c") is None:
+        pytest.skip("no C compiler")
+
+
+def run(code):
+    return executor.execute_code("#include <stdio.h>\n" + code, "c")
+
+
+def test_output(jail):
+    assert run('int main() { puts("hi"); return 3; }') == "hi\n"
+
+
+def test_compile_error(jail):
+    assert "error" in run("int main() { return x; }")
+
+
+def test_segmentation_fault(jail):
+    output = run(
+        'int main() { puts("before"); fflush(stdout);'
+        " *(volatile int *)0 = 1; }"
+    )
+
+    assert output == "before\nSegmentation fault"
+
+
+def test_cpu_limit(jail):
+    output = run("int main() { for (volatile int i = 0;; i++); }")
+
+    assert output == "Time limit exceeded"
+
+
+def test_wall_time_limit(jail):
+    # Sleeping uses no CPU, so only the jail's --time_limit stops it.
+    output = run(
+        '#include <unistd.h>\nint main() { puts("a"); fflush(stdout);'
+        " for (;;) sleep(1); }"
+    )
+
+    assert output == "a\n...\nTime limit exceeded"
+
+
+def test_output_limit(jail):
+    output = run('int main() { for (;;) puts("spam"); }')
+
+    assert output.startswith("spam\n")
+    assert output.endswith("...")
+    assert len(output) <= executor.EXEC_MAX_OUTPUT + 3
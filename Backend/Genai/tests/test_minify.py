@@ -0,0 +1,19 @@
+import pytest
+from minify import minify_html
+
+
+@pytest.mark.parametrize(
+    "html, minified",
+    [
+        ("<b>x</b> <i>y</i>", "<b>x</b> <i>y</i>"),
+        ("<p>&amp; &#169;</p>", "<p>&amp; &#169;</p>"),
+        ("<p>a  \n  b</p>", "<p>a b</p>"),
+        (
+            "<div>\n  <p>x</p>\n  <!-- note -->\n  <p>y</p>\n</div>\n",
+            "<div> <p>x</p> <p>y</p> </div>",
+        ),
+        ("<pre>  a\n    b</pre>", "<pre>  a\n    b</pre>"),
+    ],
+)
+def test_minify_html(html, minified):
+    assert minify_html(html) == minified
@@ -0,0 +1,69 @@
+import time
+import uuid
+import pytest
+
+
+@pytest.fixture
+def editor(client, gemini, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "PREFETCH_LIMIT", 2)
+    gemini.delay = 1
+    editor_id = uuid.uuid4().hex
+
+    def prefetch(code):
+        return client.post(
+            "/get-output/prefetch",
+            json={"code": code, "language": "python"},
+            headers={"X-Editor-ID": editor_id},
+            environ_base={"REMOTE_ADDR": editor_id},
+        )
+
+    return prefetch
+
+
+def wait_for(code):
+    import app
+
+    key = app.sample_key(code, "python")
+    while True:
+        with app.prefetch_lock:
+            entry = app.prefetches.get(key)
+        if entry is None or entry[0].done():
+            return
+        time.sleep(0.05)
+
+
+def test_repeat_prefetch_joins_running_one(editor, gemini):
+    code = f"print({uuid.uuid4().int})"
+
+    first = editor(code)
+    second = editor(code)
+    third = editor(code)
+    wait_for(code)
+
+    assert first.get_json() == {"status": "started"}
+    # Neither repeat cancels the first, and neither counts against the cap.
+    assert second.get_json() == {"status": "running"}
+    assert third.get_json() == {"status": "running"}
+    assert editor(code).get_json() == {"status": "ready"}
+    assert gemini.requests == 1
+    assert editor(f"print({uuid.uuid4().int})").status_code == 202
+
+
+def test_superseded_prefetch_is_not_ready(editor, gemini, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "PREFETCH_LIMIT", 3)
+    first_code = f"print({uuid.uuid4().int})"
+    second_code = f"print({uuid.uuid4().int})"
+
+    assert editor(first_code).get_json() == {"status": "started"}
+    assert editor(second_code).get_json() == {"status": "started"}
+    wait_for(first_code)
+    wait_for(second_code)
+
+    # The first was cancelled, so prefetching it again computes it.
+    assert editor(first_code).get_json() == {"status": "started"}
+    assert editor(second_code).get_json() == {"status": "ready"}
+    wait_for(first_code)
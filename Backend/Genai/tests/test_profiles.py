@@ -0,0 +1,26 @@
+import uuid
+from test_retries import HEADERS
+
+
+def generate_page(client):
+    return client.post(
+        "/htmlcssjsgenerate-code",
+        json={"prompt": uuid.uuid4().hex, "type": "html"},
+        headers=HEADERS,
+    )
+
+
+def test_page(client, gemini):
+    response = generate_page(client)
+
+    assert response.status_code == 200
+    assert response.get_json()["html"] == "print(1)\n"
+
+
+def test_page_cut_at_token_limit(client, gemini):
+    gemini.faults += ["max_tokens"]
+
+    response = generate_page(client)
+
+    assert response.status_code == 502
+    assert "cut off" in response.get_json()["error"]
@@ -0,0 +1,89 @@
+import time
+import uuid
+import jwt
+import pytest
+
+HEADERS = {
+    "Authorization": "Bearer "
+    + jwt.encode({"userId": "user-1"}, "test-secret-" + "x" * 20, algorithm="HS256")
+}
+
+
+def generate(client):
+    # A fresh description each time so no call is answered from the cache.
+    return client.post(
+        "/generate_code",
+        json={"problem_description": uuid.uuid4().hex, "language": "python"},
+        headers=HEADERS,
+    )
+
+
+def test_ok(client, gemini):
+    response = generate(client)
+
+    assert response.status_code == 200
+    assert response.get_json() == {"code": "print(1)\n"}
+    assert gemini.requests == 1
+
+
+def test_rate_limited_waits_for_retry_info(client, gemini):
+    gemini.faults += ["rate_limited"]
+    started = time.monotonic()
+
+    response = generate(client)
+
+    assert response.status_code == 200
+    assert response.get_json() == {"code": "print(1)\n"}
+    assert gemini.requests == 2
+    # The retry waited out the RetryInfo delay instead of the default pause.
+    assert 1 <= time.monotonic() - started < 5
+
+
+@pytest.mark.parametrize("failures", [1, 2])
+def test_unavailable_is_retried(client, gemini, failures):
+    gemini.faults += ["unavailable"] * failures
+
+    response = generate(client)
+
+    assert response.status_code == 200
+    assert gemini.requests == failures + 1
+
+
+def test_unavailable_gives_up_after_retry_attempts(client, gemini):
+    import retries
+
+    gemini.faults += ["unavailable"] * (retries.RETRY_ATTEMPTS + 1)
+
+    response = generate(client)
+
+    assert response.status_code == 503
+    assert gemini.requests == retries.RETRY_ATTEMPTS
+
+
+def test_bad_request_is_not_retried(client, gemini):
+    gemini.faults += ["bad_request"]
+
+    response = generate(client)
+
+    assert response.get_json() == {"code": None}
+    assert gemini.requests == 1
+
+
+def test_pause_past_deadline_is_not_waited_out(client, gemini):
+    gemini.faults += ["quota_exhausted"]
+    started = time.monotonic()
+
+    response = generate(client)
+
+    # GENAI_QUOTA_PAUSE is longer than the 10 second deadline, so the call
+    # fails at once with a Retry-After instead of sleeping.
+    assert response.status_code == 503
+    assert 25 <= int(response.headers["Retry-After"]) <= 30
+    assert gemini.requests == 1
+    assert time.monotonic() - started < 5
+
+    # Later calls are turned away without reaching the model.
+    response = generate(client)
+
+    assert response.status_code == 503
+    assert gemini.requests == 1
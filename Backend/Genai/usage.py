@@ -0,0 +1,300 @@
+import os
+import time
+import atexit
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from cache import CACHE_PATH
+
+load_dotenv()
+
+USAGE_PATH = os.getenv(
+    "GENAI_USAGE_PATH", os.path.join(os.path.dirname(CACHE_PATH), "genai-usage.db")
+)
+USAGE_FLUSH_INTERVAL = float(os.getenv("GENAI_USAGE_FLUSH_INTERVAL", 10))
+USAGE_WINDOW = int(os.getenv("GENAI_USAGE_WINDOW", 24 * 60 * 60))
+USAGE_RETENTION = int(os.getenv("GENAI_USAGE_RETENTION", 30 * 24 * 60 * 60))
+# Tokens a signed-in user may spend per window, in input-token equivalents;
+# 0 turns budgets off.
+TOKEN_BUDGET = int(os.getenv("GENAI_TOKEN_BUDGET", 2000000))
+CACHED_TOKEN_WEIGHT = float(os.getenv("GENAI_CACHED_TOKEN_WEIGHT", 0.25))
+OUTPUT_TOKEN_WEIGHT = float(os.getenv("GENAI_OUTPUT_TOKEN_WEIGHT", 4))
+MAX_PENDING_USAGE = 10000
+
+
+def token_counts(response):
+    # (prompt, cached, output) from the response's usage metadata; thinking
+    # tokens are billed as output.
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0, 0
+    return (
+        usage.prompt_token_count or 0,
+        usage.cached_content_token_count or 0,
+        (usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0),
+    )
+
+
+def billable_tokens(prompt, cached, output):
+    return (
+        prompt - cached + cached * CACHED_TOKEN_WEIGHT + output * OUTPUT_TOKEN_WEIGHT
+    )
+
+
+def window_start(now=None):
+    now = time.time() if now is None else now
+    return now - now % USAGE_WINDOW
+
+
+class UsageMeter:
+    # Token counts are summed in process and written to SQLite by a
+    # background thread, one transaction per interval, so a model call
+    # never waits on the write. Budgets read the flushed totals plus this
+    # worker's pending ones; other workers' pending counts show up after
+    # their next flush. As with TempFile's ViewCounter, the thread is
+    # started by the first record in each process, since one started at
+    # import would not survive the fork of a preloading server.
+
+    def __init__(self, path=USAGE_PATH, interval=USAGE_FLUSH_INTERVAL):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.pending_templates = {}
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS usage (
+                    window_start REAL NOT NULL,
+                    user TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    cached_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    PRIMARY KEY (window_start, user, endpoint, language, model)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS prompt_templates (
+                    template TEXT PRIMARY KEY,
+                    calls INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    max_prompt_tokens INTEGER NOT NULL
+                )
+                """
+            )
+
+        self.interval = interval
+        self.flusher_pid = None
+        atexit.register(self.flush)
+
+    def ensure_flusher(self):
+        if self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            # Counts inherited from the parent are the parent's to flush,
+            # and its SQLite connection is not safe to share across a fork.
+            self.pending = {}
+            self.pending_templates = {}
+            self.local = threading.local()
+            threading.Thread(
+                target=self.flush_forever, args=(self.interval,), daemon=True
+            ).start()
+            self.flusher_pid = os.getpid()
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def record(self, user, endpoint, language, model, template, counts):
+        self.ensure_flusher()
+        prompt, cached, output = counts
+        key = (window_start(), user or "", endpoint, language or "", str(model))
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                if len(self.pending) >= MAX_PENDING_USAGE:
+                    return
+                entry = self.pending[key] = [0, 0, 0, 0]
+            entry[0] += 1
+            entry[1] += prompt
+            entry[2] += cached
+            entry[3] += output
+
+            template_entry = self.pending_templates.setdefault(template, [0, 0, 0])
+            template_entry[0] += 1
+            template_entry[1] += prompt
+            template_entry[2] = max(template_entry[2], prompt)
+
+    def merge_back(self, batch, templates):
+        with self.lock:
+            for key, counts in batch.items():
+                entry = self.pending.setdefault(key, [0, 0, 0, 0])
+                for index, count in enumerate(counts):
+                    entry[index] += count
+            for template, (calls, prompt, largest) in templates.items():
+                entry = self.pending_templates.setdefault(template, [0, 0, 0])
+                entry[0] += calls
+                entry[1] += prompt
+                entry[2] = max(entry[2], largest)
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            templates, self.pending_templates = self.pending_templates, {}
+        if not batch and not templates:
+            return 0
+
+        try:
+            with self.connection() as connection:
+                connection.executemany(
+                    """
+                    INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (window_start, user, endpoint, language, model)
+                    DO UPDATE SET
+                        calls = calls + excluded.calls,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        cached_tokens = cached_tokens + excluded.cached_tokens,
+                        output_tokens = output_tokens + excluded.output_tokens
+                    """,
+                    [(*key, *counts) for key, counts in batch.items()],
+                )
+                connection.executemany(
+                    """
+                    INSERT INTO prompt_templates VALUES (?, ?, ?, ?)
+                    ON CONFLICT (template) DO UPDATE SET
+                        calls = calls + excluded.calls,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        max_prompt_tokens = max(
+                            max_prompt_tokens, excluded.max_prompt_tokens
+                        )
+                    """,
+                    [(template, *counts) for template, counts in templates.items()],
+                )
+                connection.execute(
+                    "DELETE FROM usage WHERE window_start < ?",
+                    (time.time() - USAGE_RETENTION,),
+                )
+        except sqlite3.Error:
+            # Keep the counts for the next flush.
+            self.merge_back(batch, templates)
+            return 0
+        return len(batch)
+
+    def flush_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def used(self, user):
+        start = window_start()
+        rows = (
+            self.connection()
+            .execute(
+                """
+                SELECT sum(prompt_tokens), sum(cached_tokens), sum(output_tokens)
+                FROM usage WHERE window_start = ? AND user = ?
+                """,
+                (start, user),
+            )
+            .fetchone()
+        )
+        prompt, cached, output = (count or 0 for count in rows)
+        with self.lock:
+            for key, counts in self.pending.items():
+                if key[0] == start and key[1] == user:
+                    prompt += counts[1]
+                    cached += counts[2]
+                    output += counts[3]
+        return billable_tokens(prompt, cached, output)
+
+    def over_budget(self, user):
+        if not user or TOKEN_BUDGET <= 0:
+            return False
+        try:
+            return self.used(user) >= TOKEN_BUDGET
+        except sqlite3.Error:
+            return False
+
+    def window_remaining(self):
+        return window_start() + USAGE_WINDOW - time.time()
+
+    def report(self, user, limit, everyone=False):
+        # Without everyone, only the given user's own usage is reported.
+        self.flush()
+        connection = self.connection()
+        start = window_start()
+
+        def grouped(column):
+            rows = connection.execute(
+                f"""
+                SELECT {column}, sum(calls), sum(prompt_tokens),
+                    sum(cached_tokens), sum(output_tokens)
+                FROM usage WHERE window_start = ? AND (? OR user = ?)
+                GROUP BY {column}
+                """,
+                (start, everyone, user),
+            ).fetchall()
+            totals = [
+                {
+                    column: name or None,
+                    "calls": calls,
+                    "promptTokens": prompt,
+                    "cachedTokens": cached,
+                    "outputTokens": output,
+                    "billableTokens": round(billable_tokens(prompt, cached, output)),
+                }
+                for name, calls, prompt, cached, output in rows
+            ]
+            totals.sort(key=lambda total: total["billableTokens"], reverse=True)
+            return totals[:limit]
+
+        report = {
+            "windowStart": start,
+            "windowSeconds": USAGE_WINDOW,
+            "budget": TOKEN_BUDGET or None,
+            "used": round(self.used(user)) if user else None,
+            "endpoints": grouped("endpoint"),
+            "languages": grouped("language"),
+            "models": grouped("model"),
+        }
+        if not everyone:
+            return report
+
+        templates = connection.execute(
+            """
+            SELECT template, calls, prompt_tokens, max_prompt_tokens
+            FROM prompt_templates
+            ORDER BY prompt_tokens DESC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+
+        return {
+            **report,
+            "users": grouped("user"),
+            "prompts": [
+                {
+                    "template": template,
+                    "calls": calls,
+                    "promptTokens": prompt,
+                    "avgPromptTokens": round(prompt / calls),
+                    "maxPromptTokens": largest,
+                }
+                for template, calls, prompt, largest in templates
+            ],
+        }
@@ -1,13 +1,39 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import (
+    Flask,
+    request,
+    jsonify,
+    render_template,
+    redirect,
+    url_for,
+    make_response,
+    Response,
+)
 from flask_cors import CORS
-import redis
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-import uuid
-import json
+import re
 import jwt
+import codecs
+import hashlib
 from functools import wraps
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from storage import (
+    FILE_META_FIELDS,
+    StorageError,
+    StorageUnavailableError,
+    ViewCounter,
+    create_storage,
+    new_file_id,
+    split_share_id,
+    validate_bundle,
+    encode_file_data,
+    encode_chunked_file_data,
+    decode_file_data,
+    chunked_file_json,
+    compute_etag,
+)
+from http_utils import VALID_EXPIRY_TIMES, cache_file_response, decode_token
 
 load_dotenv()
 
@@ -15,65 +41,163 @@ app = Flask(__name__)
 CORS(app)
 
 TEMP_FILE_URL = os.getenv("TEMP_FILE_URL")
-SECRET_KEY = os.getenv("JWT_SECRET")
-
-
-def get_redis_connection():
-    try:
-        redis_client = redis.StrictRedis(
-            host=os.getenv("REDIS_HOST"),
-            port=int(os.getenv("REDIS_PORT")),
-            password=os.getenv("REDIS_PASSWORD"),
-            ssl=True,
-        )
-        redis_client.ping()
-        return redis_client
-    except redis.ConnectionError as e:
-        app.logger.error(f"Redis connection error: {e}")
-        return None
+MAX_META_BATCH = int(os.getenv("MAX_META_BATCH", 100))
+MAX_SHARES_PAGE = int(os.getenv("MAX_SHARES_PAGE", 100))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 1024 * 1024))
+MAX_STREAM_UPLOAD_SIZE = int(os.getenv("MAX_STREAM_UPLOAD_SIZE", 16 * 1024 * 1024))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 256 * 1024))
+# Users allowed to read service-wide stats, which name other users' shares.
+ADMIN_USER_IDS = {
+    user_id.strip()
+    for user_id in os.getenv("ADMIN_USER_IDS", "").split(",")
+    if user_id.strip()
+}
+# The built SPA (Frontend/dist/index.html) and the origin that serves its
+# assets. With both set, /view/<shareId> boots the SPA over the rendered
+# share instead of serving the bare page.
+SPA_INDEX_PATH = os.getenv("SPA_INDEX_PATH")
+SPA_ORIGIN = os.getenv("SPA_ORIGIN", "").rstrip("/")
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_SIZE
+
+storage = create_storage()
+view_counter = ViewCounter(storage)
+
+
+def load_spa_head():
+    # The SPA's script and stylesheet tags, pointed at SPA_ORIGIN.
+    if not SPA_INDEX_PATH or not SPA_ORIGIN:
+        return ""
+    with open(SPA_INDEX_PATH) as index_file:
+        head = index_file.read().split("</head>", 1)[0]
+    tags = re.findall(
+        r"<script\b[^>]*\bsrc=[^>]*></script>"
+        r"|<link\b[^>]*\brel=\"?(?:stylesheet|modulepreload)\b[^>]*>",
+        head,
+    )
+    return "".join(
+        re.sub(r'\b(src|href)="/(?!/)', rf'\1="{SPA_ORIGIN}/', tag) for tag in tags
+    )
+
+
+spa_head = load_spa_head()
+
+
+def stream_file_response(share_id, record):
+    # Emit the same JSON document get_file() builds for small shares, one
+    # stored chunk at a time.
+    chunks = storage.iter_chunks(share_id, int(record["chunks"]))
+    return Response(chunked_file_json(record, chunks), mimetype="application/json")
 
 
 def token_required(f):
     @wraps(f)
     def decorator(*args, **kwargs):
-        token = None
-        if "Authorization" in request.headers:
-            auth_header = request.headers["Authorization"]
-            if auth_header.startswith("Bearer "):
-                token = auth_header.split(" ")[1]
-
-        if not token:
-            return jsonify({"message": "Token is missing!"}), 403
-
         try:
-            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            request.user_data = decoded
+            decoded = decode_token(request.headers)
         except jwt.InvalidTokenError as e:
             return jsonify({"message": "Invalid token!"}), 401
 
+        if not decoded:
+            return jsonify({"message": "Token is missing!"}), 403
+
+        request.user_data = decoded
         return f(*args, **kwargs)
 
     return decorator
 
 
+def admin_required(f):
+    # Goes below @token_required, which sets request.user_data.
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        if str(request.user_data.get("userId")) not in ADMIN_USER_IDS:
+            return jsonify({"message": "Admin access required!"}), 403
+
+        return f(*args, **kwargs)
+
+    return decorator
+
+
+def record_view(share_id, ttl):
+    # Unique viewers are estimated per client address and user agent.
+    client = f"{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+    viewer = hashlib.sha256(client.encode("utf-8")).hexdigest()[:16]
+    view_counter.record(share_id, viewer, ttl)
+
+
+@app.errorhandler(413)
+def payload_too_large(e):
+    return jsonify({"error": "Payload too large"}), 413
+
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
 
 
+@app.route("/view/<shareId>", methods=["GET"])
+def view_file(shareId):
+    # Renders the share with its code already in the page, and the payload
+    # of /file/<shareId> as JSON for the SPA, so opening a link needs no
+    # second round trip. A navigation cannot send X-File-ID; the share ID
+    # in the URL is the access check, as it is for the SPA's own links.
+    try:
+        try:
+            split_share_id(shareId)
+        except ValueError:
+            return render_template("index.html", error="Invalid share link"), 400
+
+        if request.if_none_match:
+            etag, ttl = storage.get_etag(shareId)
+            view_etag = f"{etag}-view"
+            if etag and ttl > 0 and request.if_none_match.contains(view_etag):
+                record_view(shareId, ttl)
+                return cache_file_response(make_response("", 304), view_etag, ttl)
+
+        record, ttl = storage.get(shareId)
+
+        if ttl == -2 or not record:
+            return render_template("index.html", error="File not found"), 404
+        elif ttl == -1 or ttl == 0:
+            return render_template("index.html", error="File has expired"), 410
+
+        if record.get("chunks"):
+            # Too large to inline; only the metadata is rendered.
+            share = {field: record.get(field) for field in FILE_META_FIELDS}
+        else:
+            share = decode_file_data(record)
+        share["shareId"] = shareId
+
+        record_view(shareId, ttl)
+        etag = record.get("etag") or compute_etag(decode_file_data(record))
+        response = make_response(
+            render_template("index.html", share=share, spa_head=spa_head)
+        )
+        return cache_file_response(response, f"{etag}-view", ttl), 200
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file view: {e}")
+        return render_template("index.html", error="Failed to connect to storage"), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file view: {e}")
+        return render_template("index.html", error="Failed to retrieve code"), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during file view: {e}")
+        return render_template("index.html", error="An unexpected error occurred"), 500
+
+
 @app.route("/temp-file-upload", methods=["POST"])
 @token_required
 def upload_file():
-    redis_client = get_redis_connection()
-    if not redis_client:
-        return jsonify({"error": "Failed to connect to Redis"}), 503
-
     try:
         data = request.get_json()
 
         if (
             not data
-            or not data.get("code")
+            or not (data.get("code") or data.get("files"))
             or not data.get("language")
             or not data.get("title")
             or not data.get("expiryTime")
@@ -85,16 +209,19 @@ def upload_file():
                 400,
             )
 
-        valid_expiry_times = (10, 30, 60, 1440, 10080)
+        if data.get("files") is not None:
+            bundle_error = validate_bundle(data["files"])
+            if bundle_error:
+                return jsonify({"error": bundle_error}), 400
+
         expiry_time_minutes = int(data["expiryTime"])
 
-        if expiry_time_minutes not in valid_expiry_times:
+        if expiry_time_minutes not in VALID_EXPIRY_TIMES:
             return (
                 jsonify({"error": "Invalid expiry time. Please choose a valid value."}),
                 400,
             )
 
-        code = data["code"]
         language = data["language"]
         title = data["title"]
 
@@ -102,19 +229,23 @@ def upload_file():
         expiry_time = current_time + timedelta(minutes=expiry_time_minutes)
         formatted_expiry_time = expiry_time.strftime("%Y-%m-%d %H:%M:%S UTC")
 
-        file_id = str(uuid.uuid4())
+        file_id = new_file_id()
 
         file_data = {
             "title": title,
-            "code": code,
             "language": language,
             "expiry_time": formatted_expiry_time,
         }
+        if data.get("files") is not None:
+            file_data["files"] = data["files"]
+        else:
+            file_data["code"] = data["code"]
 
-        redis_client.set(
-            f"file:{language}-{file_id}:data",
-            json.dumps(file_data),
-            ex=expiry_time_minutes * 60,
+        storage.put(
+            f"{language}-{file_id}",
+            encode_file_data(file_data),
+            expiry_time_minutes * 60,
+            owner=request.user_data.get("userId"),
         )
 
         file_url = f"{TEMP_FILE_URL}/file/{language}-{file_id}"
@@ -127,24 +258,130 @@ def upload_file():
             }
         )
 
-    except redis.RedisError as e:
-        app.logger.error(f"Redis error during file upload: {e}")
-        return jsonify({"error": "Failed to store code in Redis"}), 500
+    except RequestEntityTooLarge as e:
+        return payload_too_large(e)
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file upload: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file upload: {e}")
+        return jsonify({"error": "Failed to store code"}), 500
 
     except Exception as e:
         app.logger.error(f"Unexpected error during file upload: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        redis_client.close()
+
+@app.route("/temp-file-upload/stream", methods=["POST"])
+@token_required
+def upload_file_stream():
+    # Large shares: the raw code is the request body and the metadata comes
+    # in the query string, so the body is never held in memory at once.
+    request.max_content_length = MAX_STREAM_UPLOAD_SIZE
+
+    language = request.args.get("language")
+    title = request.args.get("title")
+    expiry_time_param = request.args.get("expiryTime")
+
+    if not language or not title or not expiry_time_param:
+        return (
+            jsonify({"error": "Code, language, title, and expiry time are required"}),
+            400,
+        )
+
+    try:
+        expiry_time_minutes = int(expiry_time_param)
+    except ValueError:
+        expiry_time_minutes = None
+
+    if expiry_time_minutes not in VALID_EXPIRY_TIMES:
+        return (
+            jsonify({"error": "Invalid expiry time. Please choose a valid value."}),
+            400,
+        )
+
+    share_id = f"{language}-{new_file_id()}"
+    ttl = expiry_time_minutes * 60
+
+    try:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        code_digest = hashlib.sha256()
+        size = 0
+        chunks = 0
+
+        while True:
+            data = request.stream.read(STREAM_CHUNK_SIZE)
+            chunk = decoder.decode(data, final=not data)
+            if chunk:
+                storage.append_chunk(share_id, chunk, ttl)
+                chunks += 1
+            if not data:
+                break
+
+            size += len(data)
+            code_digest.update(data)
+            if size > MAX_STREAM_UPLOAD_SIZE:
+                raise RequestEntityTooLarge()
+
+        if not size:
+            return (
+                jsonify({"error": "Code, language, title, and expiry time are required"}),
+                400,
+            )
+
+        current_time = datetime.utcnow()
+        expiry_time = current_time + timedelta(minutes=expiry_time_minutes)
+        formatted_expiry_time = expiry_time.strftime("%Y-%m-%d %H:%M:%S UTC")
+
+        file_data = {
+            "title": title,
+            "language": language,
+            "expiry_time": formatted_expiry_time,
+        }
+
+        storage.put(
+            share_id,
+            encode_chunked_file_data(
+                file_data, code_digest.hexdigest(), size, chunks
+            ),
+            ttl,
+            owner=request.user_data.get("userId"),
+        )
+
+        return jsonify(
+            {
+                "message": "Code uploaded successfully",
+                "fileUrl": f"{TEMP_FILE_URL}/file/{share_id}",
+                "expiry_time": formatted_expiry_time,
+            }
+        )
+
+    except (RequestEntityTooLarge, UnicodeDecodeError) as e:
+        try:
+            storage.delete(share_id)
+        except StorageError:
+            pass
+        if isinstance(e, UnicodeDecodeError):
+            return jsonify({"error": "Code must be UTF-8 text"}), 400
+        return payload_too_large(e)
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during streamed file upload: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during streamed file upload: {e}")
+        return jsonify({"error": "Failed to store code"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during streamed file upload: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
 
 
 @app.route("/file/<shareId>", methods=["GET"])
 def get_file(shareId):
-    redis_client = get_redis_connection()
-    if not redis_client:
-        return jsonify({"error": "Failed to connect to Redis"}), 503
-
     try:
         header_shareId = request.headers.get("X-File-ID")
         
@@ -152,67 +389,295 @@ def get_file(shareId):
             return redirect(url_for('index'))
         
         try:
-            language, file_id = shareId.split("-", 1)
+            split_share_id(shareId)
         except ValueError:
             return jsonify({"error": "Invalid 'shareId' format. It should be 'language-file_id'."}), 400
 
-        file_key = f"file:{language}-{file_id}:data"
-        file_data = redis_client.get(file_key)
-        ttl = redis_client.ttl(file_key)
+        if request.if_none_match:
+            etag, ttl = storage.get_etag(shareId)
+            if etag and ttl > 0 and request.if_none_match.contains(etag):
+                record_view(shareId, ttl)
+                return cache_file_response(make_response("", 304), etag, ttl)
+
+        record, ttl = storage.get(shareId)
 
         if ttl == -2:
             return jsonify({"error": "File not found"}), 404
         elif ttl == -1 or ttl == 0:
             return jsonify({"error": "File has expired"}), 410
 
-        if file_data:
-            file_data = json.loads(file_data)
-            return jsonify(file_data), 200
+        if record:
+            record_view(shareId, ttl)
+
+        if record and record.get("chunks"):
+            return cache_file_response(
+                stream_file_response(shareId, record), record.get("etag"), ttl
+            ), 200
+
+        if record:
+            file_data = decode_file_data(record)
+            etag = record.get("etag") or compute_etag(file_data)
+            return cache_file_response(jsonify(file_data), etag, ttl), 200
 
         return jsonify({"error": "File not found"}), 404
 
-    except redis.RedisError as e:
-        app.logger.error(f"Redis error during file retrieval: {e}")
-        return jsonify({"error": "Failed to retrieve code from Redis"}), 500
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file retrieval: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file retrieval: {e}")
+        return jsonify({"error": "Failed to retrieve code"}), 500
 
     except Exception as e:
         app.logger.error(f"Unexpected error during file retrieval: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        redis_client.close()
 
+@app.route("/file/<shareId>/meta", methods=["GET"])
+def get_file_meta(shareId):
+    try:
+        header_shareId = request.headers.get("X-File-ID")
 
-@app.route("/file/<file_id>/delete", methods=["DELETE"])
+        if not header_shareId or header_shareId != shareId:
+            return redirect(url_for('index'))
+
+        try:
+            split_share_id(shareId)
+        except ValueError:
+            return jsonify({"error": "Invalid 'shareId' format. It should be 'language-file_id'."}), 400
+
+        [(file_meta, ttl)] = storage.get_meta([shareId])
+
+        if ttl == -2:
+            return jsonify({"error": "File not found"}), 404
+        elif ttl == -1 or ttl == 0:
+            return jsonify({"error": "File has expired"}), 410
+
+        return jsonify({**file_meta, "ttl": ttl}), 200
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file metadata retrieval: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file metadata retrieval: {e}")
+        return jsonify({"error": "Failed to retrieve code"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during file metadata retrieval: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/file/<shareId>/files/<path:name>", methods=["GET"])
+def get_bundle_file(shareId, name):
+    try:
+        header_shareId = request.headers.get("X-File-ID")
+
+        if not header_shareId or header_shareId != shareId:
+            return redirect(url_for('index'))
+
+        try:
+            split_share_id(shareId)
+        except ValueError:
+            return jsonify({"error": "Invalid 'shareId' format. It should be 'language-file_id'."}), 400
+
+        content, ttl = storage.get_bundle_file(shareId, name)
+
+        if ttl == -2:
+            return jsonify({"error": "File not found"}), 404
+        elif ttl == -1 or ttl == 0:
+            return jsonify({"error": "File has expired"}), 410
+
+        if content is None:
+            return jsonify({"error": "File not found in bundle"}), 404
+
+        return (
+            cache_file_response(
+                jsonify({"name": name, "content": content}), None, ttl
+            ),
+            200,
+        )
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during bundle file retrieval: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during bundle file retrieval: {e}")
+        return jsonify({"error": "Failed to retrieve code"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during bundle file retrieval: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/files/meta", methods=["POST"])
 @token_required
-def delete_file(file_id):
-    redis_client = get_redis_connection()
-    if not redis_client:
-        return jsonify({"error": "Failed to connect to Redis"}), 503
+def get_files_meta():
+    data = request.get_json(silent=True) or {}
+    share_ids = data.get("shareIds")
+
+    if not isinstance(share_ids, list) or not share_ids:
+        return jsonify({"error": "A non-empty 'shareIds' list is required"}), 400
+
+    if len(share_ids) > MAX_META_BATCH:
+        return (
+            jsonify({"error": f"At most {MAX_META_BATCH} share IDs can be requested at once"}),
+            400,
+        )
+
+    try:
+        files = [{"shareId": share_id} for share_id in share_ids]
+        valid = []
+        for index, share_id in enumerate(share_ids):
+            if isinstance(share_id, str) and "-" in share_id:
+                valid.append(index)
+            else:
+                files[index]["status"] = "invalid"
+
+        file_metas = storage.get_meta([share_ids[index] for index in valid])
+        for index, (file_meta, ttl) in zip(valid, file_metas):
+            if ttl == -2:
+                files[index]["status"] = "missing"
+            elif ttl == -1 or ttl == 0:
+                files[index]["status"] = "expired"
+            else:
+                files[index].update(file_meta)
+                files[index]["ttl"] = ttl
+                files[index]["status"] = "ok"
+
+        return jsonify({"files": files}), 200
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during batch metadata retrieval: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during batch metadata retrieval: {e}")
+        return jsonify({"error": "Failed to retrieve code"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during batch metadata retrieval: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/files/mine", methods=["GET"])
+@token_required
+def get_my_files():
+    owner = request.user_data.get("userId")
+    if not owner:
+        return jsonify({"error": "Token does not identify a user"}), 400
 
     try:
-        language, file_id = file_id.split("-", 1)
+        limit = min(int(request.args.get("limit", 20)), MAX_SHARES_PAGE)
+        cursor = request.args.get("cursor")
+        if cursor:
+            score, _, after = cursor.partition(":")
+            cursor = (int(score), after or None)
+        else:
+            cursor = None
+    except ValueError:
+        return jsonify({"error": "Invalid 'limit' or 'cursor'"}), 400
 
-        file_key = f"file:{language}-{file_id}:data"
-        file_data = redis_client.get(file_key)
+    if limit < 1:
+        return jsonify({"error": "'limit' must be positive"}), 400
 
-        if file_data:
-            redis_client.delete(file_key)
+    try:
+        entries, total = storage.list_user_shares(owner, cursor, limit)
+        file_metas = storage.get_meta([share_id for share_id, _ in entries])
+
+        files = []
+        for (share_id, _), (file_meta, ttl) in zip(entries, file_metas):
+            # Deleted, or expired between the index read and the lookup.
+            if ttl <= 0:
+                continue
+            files.append({"shareId": share_id, **file_meta, "ttl": ttl})
+
+        next_cursor = (
+            f"{entries[-1][1]}:{entries[-1][0]}" if len(entries) == limit else None
+        )
+
+        return jsonify({"files": files, "total": total, "nextCursor": next_cursor}), 200
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during share listing: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during share listing: {e}")
+        return jsonify({"error": "Failed to list shared files"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during share listing: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/stats/top-shares", methods=["GET"])
+@token_required
+@admin_required
+def get_top_shares():
+    try:
+        limit = min(int(request.args.get("limit", 10)), MAX_SHARES_PAGE)
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer"}), 400
+
+    if limit < 1:
+        return jsonify({"error": "'limit' must be positive"}), 400
+
+    try:
+        top = storage.top_shares(limit)
+        file_metas = storage.get_meta([entry["shareId"] for entry in top])
+
+        shares = []
+        for entry, (file_meta, ttl) in zip(top, file_metas):
+            if ttl <= 0:
+                continue
+            shares.append({**entry, **file_meta, "ttl": ttl})
+
+        return jsonify({"shares": shares}), 200
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during top shares retrieval: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during top shares retrieval: {e}")
+        return jsonify({"error": "Failed to retrieve share stats"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during top shares retrieval: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/metrics/storage", methods=["GET"])
+@token_required
+@admin_required
+def storage_metrics():
+    return jsonify({"nodes": storage.node_stats()}), 200
+
+
+@app.route("/file/<file_id>/delete", methods=["DELETE"])
+@token_required
+def delete_file(file_id):
+    try:
+        if storage.delete(file_id, owner=request.user_data.get("userId")):
             return jsonify({"message": "File deleted successfully"}), 200
         else:
             return jsonify({"error": "File not found"}), 404
 
-    except redis.RedisError as e:
-        app.logger.error(f"Redis error during file deletion: {e}")
-        return jsonify({"error": "Failed to delete file from Redis"}), 500
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file deletion: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file deletion: {e}")
+        return jsonify({"error": "Failed to delete file"}), 500
 
     except Exception as e:
         app.logger.error(f"Unexpected error during file deletion: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        redis_client.close()
-
 
 if __name__ == "__main__":
     app.run(debug=False, port=5001)
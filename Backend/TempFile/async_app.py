@@ -0,0 +1,235 @@
+from quart import (
+    Quart,
+    request,
+    jsonify,
+    render_template,
+    redirect,
+    url_for,
+    make_response,
+    Response,
+)
+from quart_cors import cors
+import os
+import jwt
+from functools import wraps
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from storage import (
+    StorageError,
+    StorageUnavailableError,
+    AsyncRedisStorage,
+    new_file_id,
+    split_share_id,
+    validate_bundle,
+    encode_file_data,
+    decode_file_data,
+    async_chunked_file_json,
+    compute_etag,
+)
+from http_utils import VALID_EXPIRY_TIMES, cache_file_response, decode_token
+
+load_dotenv()
+
+app = Quart(__name__)
+app = cors(app)
+
+TEMP_FILE_URL = os.getenv("TEMP_FILE_URL")
+
+storage = AsyncRedisStorage()
+
+
+@app.before_serving
+async def open_storage():
+    await storage.open()
+
+
+@app.after_serving
+async def close_storage():
+    await storage.close()
+
+
+def stream_file_response(share_id, record):
+    chunks = storage.iter_chunks(share_id, int(record["chunks"]))
+    return Response(
+        async_chunked_file_json(record, chunks), mimetype="application/json"
+    )
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorator(*args, **kwargs):
+        try:
+            decoded = decode_token(request.headers)
+        except jwt.InvalidTokenError as e:
+            return jsonify({"message": "Invalid token!"}), 401
+
+        if not decoded:
+            return jsonify({"message": "Token is missing!"}), 403
+
+        request.user_data = decoded
+        return await f(*args, **kwargs)
+
+    return decorator
+
+
+@app.route("/", methods=["GET"])
+async def index():
+    return await render_template("index.html")
+
+
+@app.route("/temp-file-upload", methods=["POST"])
+@token_required
+async def upload_file():
+    try:
+        data = await request.get_json()
+
+        if (
+            not data
+            or not (data.get("code") or data.get("files"))
+            or not data.get("language")
+            or not data.get("title")
+            or not data.get("expiryTime")
+        ):
+            return (
+                jsonify(
+                    {"error": "Code, language, title, and expiry time are required"}
+                ),
+                400,
+            )
+
+        if data.get("files") is not None:
+            bundle_error = validate_bundle(data["files"])
+            if bundle_error:
+                return jsonify({"error": bundle_error}), 400
+
+        expiry_time_minutes = int(data["expiryTime"])
+
+        if expiry_time_minutes not in VALID_EXPIRY_TIMES:
+            return (
+                jsonify({"error": "Invalid expiry time. Please choose a valid value."}),
+                400,
+            )
+
+        language = data["language"]
+        title = data["title"]
+
+        current_time = datetime.utcnow()
+        expiry_time = current_time + timedelta(minutes=expiry_time_minutes)
+        formatted_expiry_time = expiry_time.strftime("%Y-%m-%d %H:%M:%S UTC")
+
+        file_id = new_file_id()
+
+        file_data = {
+            "title": title,
+            "language": language,
+            "expiry_time": formatted_expiry_time,
+        }
+        if data.get("files") is not None:
+            file_data["files"] = data["files"]
+        else:
+            file_data["code"] = data["code"]
+
+        await storage.put(
+            f"{language}-{file_id}",
+            encode_file_data(file_data),
+            expiry_time_minutes * 60,
+            owner=request.user_data.get("userId"),
+        )
+
+        file_url = f"{TEMP_FILE_URL}/file/{language}-{file_id}"
+
+        return jsonify(
+            {
+                "message": "Code uploaded successfully",
+                "fileUrl": file_url,
+                "expiry_time": formatted_expiry_time,
+            }
+        )
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file upload: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file upload: {e}")
+        return jsonify({"error": "Failed to store code"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during file upload: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/file/<shareId>", methods=["GET"])
+async def get_file(shareId):
+    try:
+        header_shareId = request.headers.get("X-File-ID")
+
+        if not header_shareId or header_shareId != shareId:
+            return redirect(url_for('index'))
+
+        try:
+            split_share_id(shareId)
+        except ValueError:
+            return jsonify({"error": "Invalid 'shareId' format. It should be 'language-file_id'."}), 400
+
+        if request.if_none_match:
+            etag, ttl = await storage.get_etag(shareId)
+            if etag and ttl > 0 and request.if_none_match.contains(etag):
+                return cache_file_response(await make_response("", 304), etag, ttl)
+
+        record, ttl = await storage.get(shareId)
+
+        if ttl == -2:
+            return jsonify({"error": "File not found"}), 404
+        elif ttl == -1 or ttl == 0:
+            return jsonify({"error": "File has expired"}), 410
+
+        if record and record.get("chunks"):
+            return cache_file_response(
+                stream_file_response(shareId, record), record.get("etag"), ttl
+            ), 200
+
+        if record:
+            file_data = decode_file_data(record)
+            etag = record.get("etag") or compute_etag(file_data)
+            return cache_file_response(jsonify(file_data), etag, ttl), 200
+
+        return jsonify({"error": "File not found"}), 404
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file retrieval: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file retrieval: {e}")
+        return jsonify({"error": "Failed to retrieve code"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during file retrieval: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/file/<file_id>/delete", methods=["DELETE"])
+@token_required
+async def delete_file(file_id):
+    try:
+        if await storage.delete(file_id, owner=request.user_data.get("userId")):
+            return jsonify({"message": "File deleted successfully"}), 200
+        else:
+            return jsonify({"error": "File not found"}), 404
+
+    except StorageUnavailableError as e:
+        app.logger.error(f"Storage unavailable during file deletion: {e}")
+        return jsonify({"error": "Failed to connect to storage"}), 503
+
+    except StorageError as e:
+        app.logger.error(f"Storage error during file deletion: {e}")
+        return jsonify({"error": "Failed to delete file"}), 500
+
+    except Exception as e:
+        app.logger.error(f"Unexpected error during file deletion: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=False, port=5001)
@@ -0,0 +1,33 @@
+import os
+import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SECRET_KEY = os.getenv("JWT_SECRET")
+VALID_EXPIRY_TIMES = (10, 30, 60, 1440, 10080)
+
+
+def cache_file_response(response, etag, ttl):
+    # Shares are immutable, so a response stays valid until the key expires.
+    if etag:
+        response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = ttl
+    response.vary.add("X-File-ID")
+    return response
+
+
+def decode_token(headers):
+    # The claims of the request's bearer token, or None without one. Raises
+    # jwt.InvalidTokenError when the token does not verify.
+    token = None
+    if "Authorization" in headers:
+        auth_header = headers["Authorization"]
+        if auth_header.startswith("Bearer "):
+            token = auth_header.split(" ")[1]
+
+    if not token:
+        return None
+
+    return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
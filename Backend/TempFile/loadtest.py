@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import asyncio
+import httpx
+import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Usage: python loadtest.py <base url> [concurrency] [seconds]
+#
+# Uploads a few shares, then keeps `concurrency` clients fetching them
+# through /file/<shareId> and reports throughput and latency. Run it once
+# against app.py and once against async_app.py, both pointed at the same
+# local Redis, to compare the two apps; or against app.py started once
+# with STORAGE_BACKEND=redis and once with STORAGE_BACKEND=sqlite to
+# compare the storage backends.
+
+SHARES = int(os.getenv("LOADTEST_SHARES", 50))
+CODE_SIZE = int(os.getenv("LOADTEST_CODE_SIZE", 2048))
+
+
+async def upload_shares(client, token):
+    share_ids = []
+    for index in range(SHARES):
+        response = await client.post(
+            "/temp-file-upload",
+            json={
+                "code": f"# share {index}\n".ljust(CODE_SIZE, "x"),
+                "language": "python",
+                "title": f"load test {index}",
+                "expiryTime": 10,
+            },
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        share_ids.append(response.json()["fileUrl"].rsplit("/", 1)[1])
+    return share_ids
+
+
+async def fetch_forever(client, share_ids, stop_at, latencies, errors):
+    index = 0
+    while time.monotonic() < stop_at:
+        share_id = share_ids[index % len(share_ids)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(
+                f"/file/{share_id}", headers={"X-File-ID": share_id}
+            )
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def main(base_url, concurrency, seconds):
+    # No userId, so the shares stay out of every user's index.
+    token = jwt.encode({"loadtest": True}, os.getenv("JWT_SECRET"), algorithm="HS256")
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+        share_ids = await upload_shares(client, token)
+
+        latencies = []
+        errors = []
+        stop_at = time.monotonic() + seconds
+        await asyncio.gather(
+            *(
+                fetch_forever(client, share_ids, stop_at, latencies, errors)
+                for _ in range(concurrency)
+            )
+        )
+
+        for share_id in share_ids:
+            await client.delete(
+                f"/file/{share_id}/delete",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+    latencies.sort()
+    if not latencies:
+        print(f"no successful requests, {len(errors)} errors")
+        return
+    print(
+        f"{base_url} concurrency={concurrency}: "
+        f"{len(latencies) / seconds:.0f} req/s, "
+        f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, "
+        f"{len(errors)} errors"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            sys.argv[1],
+            int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+            float(sys.argv[3]) if len(sys.argv) > 3 else 10,
+        )
+    )
@@ -0,0 +1,1229 @@
+import os
+import re
+import json
+import time
+import atexit
+import string
+import sqlite3
+import hashlib
+import secrets
+import threading
+import redis
+import redis.asyncio as aioredis
+from functools import wraps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FILE_FIELDS = ("title", "code", "language", "expiry_time")
+FILE_META_FIELDS = ("title", "language", "expiry_time")
+BUNDLE_FILE_PREFIX = "file:"
+MAX_BUNDLE_FILES = int(os.getenv("MAX_BUNDLE_FILES", 20))
+
+SHARE_ID_ALPHABET = string.digits + string.ascii_letters
+SHARE_ID_LENGTH = 22
+LEGACY_FILE_ID_REGEX = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+)
+
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() == "true"
+# Plain TCP is only meant for a local Redis, e.g. in load tests.
+REDIS_SSL = os.getenv("REDIS_SSL", "true").lower() == "true"
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 64))
+REDIS_REPLICAS = [
+    replica.strip()
+    for replica in os.getenv("REDIS_REPLICAS", "").split(",")
+    if replica.strip()
+]
+REPLICA_RETRY_AFTER = float(os.getenv("REPLICA_RETRY_AFTER", 30))
+REPLICA_SOCKET_TIMEOUT = float(os.getenv("REPLICA_SOCKET_TIMEOUT", 0.5))
+
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", 5))
+MAX_PENDING_VIEWS = int(os.getenv("MAX_PENDING_VIEWS", 10000))
+MAX_TOP_SHARES = int(os.getenv("MAX_TOP_SHARES", 1000))
+TOP_SHARES_KEY = "stats:top_shares"
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageUnavailableError(StorageError):
+    pass
+
+
+def new_file_id():
+    # 22 base62 characters carry ~131 random bits, more than a uuid4.
+    return "".join(
+        secrets.choice(SHARE_ID_ALPHABET) for _ in range(SHARE_ID_LENGTH)
+    )
+
+
+def split_share_id(share_id):
+    language, file_id = share_id.split("-", 1)
+    return language, file_id
+
+
+def file_key_for(share_id):
+    language, file_id = split_share_id(share_id)
+    if LEGACY_FILE_ID_REGEX.fullmatch(file_id):
+        return f"file:{language}-{file_id}:data"
+    # Keyspace v2: the whole share ID is the cluster hash tag, so every key
+    # belonging to a share maps to the same slot.
+    return f"f2:{{{language}-{file_id}}}"
+
+
+def is_bundle(code):
+    return isinstance(code, dict) and all(
+        isinstance(name, str) and isinstance(content, str)
+        for name, content in code.items()
+    )
+
+
+def validate_bundle(files):
+    if not isinstance(files, dict) or not files:
+        return "'files' must map file names to their contents"
+    if len(files) > MAX_BUNDLE_FILES:
+        return f"A bundle can hold at most {MAX_BUNDLE_FILES} files"
+    if not is_bundle(files) or not all(0 < len(name) <= 255 for name in files):
+        return "Bundle file names must be 1-255 characters and contents must be strings"
+    return None
+
+
+def chunks_key_for(share_id):
+    return f"{file_key_for(share_id)}:chunks"
+
+
+def user_shares_key_for(user_id):
+    return f"u2:{{{user_id}}}:shares"
+
+
+def views_key_for(share_id):
+    return f"{file_key_for(share_id)}:views"
+
+
+def viewers_key_for(share_id):
+    return f"{file_key_for(share_id)}:viewers"
+
+
+def compute_etag(file_data):
+    payload = json.dumps(file_data, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def encode_file_data(file_data):
+    record = {field: file_data[field] for field in FILE_META_FIELDS}
+    record["etag"] = compute_etag(file_data)
+
+    if "files" in file_data:
+        files = file_data["files"]
+    elif is_bundle(file_data["code"]):
+        # The htmlcssjs editor uploads {html, css, javascript} as its code;
+        # store it as a bundle but keep answering with a "code" object.
+        files = file_data["code"]
+        record["encoding"] = "bundle"
+    else:
+        code = file_data["code"]
+        if not isinstance(code, str):
+            code = json.dumps(code)
+            record["encoding"] = "json"
+        record["code"] = code
+        record["size"] = len(code.encode("utf-8"))
+        return record
+
+    # Every file of a bundle is its own field, so one file can be read
+    # without the others.
+    record["bundle"] = json.dumps(list(files))
+    record["size"] = sum(len(content.encode("utf-8")) for content in files.values())
+    for name, content in files.items():
+        record[BUNDLE_FILE_PREFIX + name] = content
+    return record
+
+
+def encode_chunked_file_data(file_data, code_digest, size, chunks):
+    # The code of a streamed upload never exists in one piece, so the etag
+    # covers a digest of it instead of the code itself.
+    record = {field: file_data[field] for field in FILE_META_FIELDS}
+    record["etag"] = compute_etag({**file_data, "code_sha256": code_digest})
+    record["size"] = size
+    record["chunks"] = chunks
+    return record
+
+
+def decode_file_data(record):
+    file_data = {field: record.get(field) for field in FILE_META_FIELDS}
+
+    if record.get("bundle"):
+        files = {
+            name: record.get(BUNDLE_FILE_PREFIX + name, "")
+            for name in json.loads(record["bundle"])
+        }
+        if record.get("encoding") == "bundle":
+            file_data["code"] = files
+        else:
+            file_data["files"] = files
+        return file_data
+
+    file_data["code"] = record.get("code")
+    if record.get("encoding") == "json":
+        file_data["code"] = json.loads(file_data["code"])
+    return file_data
+
+
+def chunked_file_json(record, chunks):
+    # The JSON document of a chunked share, built piece by piece from its
+    # stored chunks so the code never sits in memory at once.
+    file_data = {field: record.get(field) for field in FILE_META_FIELDS}
+    yield json.dumps(file_data)[:-1] + ', "code": "'
+    for chunk in chunks:
+        yield json.dumps(chunk)[1:-1]
+    yield '"}'
+
+
+async def async_chunked_file_json(record, chunks):
+    file_data = {field: record.get(field) for field in FILE_META_FIELDS}
+    yield json.dumps(file_data)[:-1] + ', "code": "'
+    async for chunk in chunks:
+        yield json.dumps(chunk)[1:-1]
+    yield '"}'
+
+
+def build_file_meta(meta_values, size, bundle):
+    file_meta = dict(zip(FILE_META_FIELDS, meta_values))
+    file_meta["size"] = size
+    if bundle:
+        file_meta["files"] = json.loads(bundle)
+    return file_meta
+
+
+def is_wrong_type(result):
+    return isinstance(result, redis.ResponseError) and str(result).startswith(
+        "WRONGTYPE"
+    )
+
+
+def raise_errors(results):
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+def translate_errors(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            raise StorageUnavailableError(str(e)) from e
+        except (redis.RedisError, sqlite3.Error) as e:
+            raise StorageError(str(e)) from e
+
+    return wrapper
+
+
+def async_translate_errors(f):
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await f(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            raise StorageUnavailableError(str(e)) from e
+        except redis.RedisError as e:
+            raise StorageError(str(e)) from e
+
+    return wrapper
+
+
+def page_start(cursor, now):
+    # A cursor is the (expiry score, share ID) of the last share of the
+    # previous page; the ID is None for the older score-only cursors.
+    if cursor is None or cursor[0] < now:
+        return now, None
+    return cursor
+
+
+def queue_share_writes(pipe, share_id, record, ttl, owner=None):
+    file_key = file_key_for(share_id)
+    pipe.hset(file_key, mapping=record)
+    pipe.expire(file_key, ttl)
+    if record.get("chunks"):
+        pipe.expire(chunks_key_for(share_id), ttl)
+
+    if owner:
+        user_key = user_shares_key_for(owner)
+        pipe.zadd(user_key, {share_id: int((time.time() + ttl) * 1000)})
+        pipe.expire(user_key, ttl, nx=True)
+        pipe.expire(user_key, ttl, gt=True)
+
+
+def queue_share_deletes(pipe, share_id, owner=None):
+    # Every key a share owns; the file key goes first so its result tells
+    # whether the share existed.
+    pipe.delete(file_key_for(share_id))
+    pipe.delete(chunks_key_for(share_id))
+    pipe.delete(views_key_for(share_id))
+    pipe.delete(viewers_key_for(share_id))
+    pipe.zrem(TOP_SHARES_KEY, share_id)
+    if owner:
+        pipe.zrem(user_shares_key_for(owner), share_id)
+
+
+class NodeStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {}
+
+    def record(self, node, elapsed, failed=False):
+        with self.lock:
+            stats = self.nodes.setdefault(
+                node, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["total_ms"] += elapsed * 1000
+            stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                node: {**stats, "avg_ms": stats["total_ms"] / stats["calls"]}
+                for node, stats in self.nodes.items()
+            }
+
+
+class ViewCounter:
+    # Views are counted in process and written out by a background thread
+    # in one batch per interval, so serving a share never waits on them.
+    # The thread is started by the first view in each process: one started
+    # at import would not survive the fork of a preloading server.
+
+    def __init__(self, storage, interval=VIEW_FLUSH_INTERVAL):
+        self.storage = storage
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flusher_pid = None
+        atexit.register(self.flush)
+
+    def ensure_flusher(self):
+        if self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            # Counts inherited from the parent are the parent's to flush.
+            self.pending = {}
+            threading.Thread(
+                target=self.flush_forever, args=(self.interval,), daemon=True
+            ).start()
+            self.flusher_pid = os.getpid()
+
+    def record(self, share_id, viewer, ttl):
+        self.ensure_flusher()
+        with self.lock:
+            entry = self.pending.get(share_id)
+            if entry is None:
+                if len(self.pending) >= MAX_PENDING_VIEWS:
+                    return
+                entry = self.pending[share_id] = [0, set(), ttl]
+            entry[0] += 1
+            entry[1].add(viewer)
+            entry[2] = ttl
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return 0
+
+        try:
+            self.storage.record_views(batch)
+        except StorageError:
+            # Keep the counts for the next flush while there is room.
+            with self.lock:
+                for share_id, (views, viewers, ttl) in batch.items():
+                    entry = self.pending.get(share_id)
+                    if entry is None:
+                        if len(self.pending) >= MAX_PENDING_VIEWS:
+                            continue
+                        entry = self.pending[share_id] = [0, set(), ttl]
+                    entry[0] += views
+                    entry[1] |= viewers
+            return 0
+        return len(batch)
+
+    def flush_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+
+class RedisStorage:
+    # TTLs follow Redis conventions throughout: -2 when the share does not
+    # exist and -1 when it exists without an expiry.
+    #
+    # Writes, deletes and legacy migrations always go to the primary. Reads
+    # are spread over REDIS_REPLICAS and fall back to the primary when a
+    # replica is down or does not have the share yet.
+
+    def __init__(self):
+        redis_class = redis.RedisCluster if REDIS_CLUSTER else redis.StrictRedis
+        self.redis_client = redis_class(
+            host=os.getenv("REDIS_HOST"),
+            port=int(os.getenv("REDIS_PORT")),
+            password=os.getenv("REDIS_PASSWORD"),
+            ssl=REDIS_SSL,
+            decode_responses=True,
+        )
+        primary = f"{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}"
+        self.node_names = {id(self.redis_client): primary}
+
+        # A cluster routes reads to its own replicas.
+        self.replicas = []
+        for replica in [] if REDIS_CLUSTER else REDIS_REPLICAS:
+            host, _, port = replica.rpartition(":")
+            replica_client = redis.StrictRedis(
+                host=host,
+                port=int(port),
+                password=os.getenv("REDIS_PASSWORD"),
+                ssl=REDIS_SSL,
+                decode_responses=True,
+                socket_timeout=REPLICA_SOCKET_TIMEOUT,
+                socket_connect_timeout=REPLICA_SOCKET_TIMEOUT,
+            )
+            self.node_names[id(replica_client)] = replica
+            self.replicas.append(replica_client)
+
+        self.replica_lock = threading.Lock()
+        self.replica_turn = 0
+        self.replica_down_until = {}
+        self.stats = NodeStats()
+
+    def pick_replica(self):
+        with self.replica_lock:
+            now = time.monotonic()
+            for _ in range(len(self.replicas)):
+                replica = self.replicas[self.replica_turn % len(self.replicas)]
+                self.replica_turn += 1
+                if self.replica_down_until.get(id(replica), 0) <= now:
+                    return replica
+        return None
+
+    def mark_replica_down(self, replica):
+        with self.replica_lock:
+            self.replica_down_until[id(replica)] = (
+                time.monotonic() + REPLICA_RETRY_AFTER
+            )
+
+    def run_pipeline(self, client, queue_commands, transaction=False):
+        pipe = client.pipeline(transaction=transaction)
+        queue_commands(pipe)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return pipe.execute(raise_on_error=False)
+        except redis.RedisError:
+            failed = True
+            raise
+        finally:
+            self.stats.record(
+                self.node_names[id(client)], time.perf_counter() - started, failed
+            )
+
+    def run_replica_pipeline(self, queue_commands):
+        replica = self.pick_replica()
+        if replica is None:
+            return None
+        try:
+            return self.run_pipeline(replica, queue_commands)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.mark_replica_down(replica)
+            return None
+
+    def node_stats(self):
+        return self.stats.snapshot()
+
+    def migrate_legacy_file(self, file_key):
+        # Shares used to be stored as a single JSON string; rewrite them as a
+        # hash in place, keeping the remaining TTL.
+        def migrate(pipe):
+            try:
+                legacy_data = pipe.get(file_key)
+            except redis.ResponseError:
+                return
+            ttl = pipe.pttl(file_key)
+            if not legacy_data or ttl <= 0:
+                return
+            pipe.multi()
+            pipe.delete(file_key)
+            pipe.hset(file_key, mapping=encode_file_data(json.loads(legacy_data)))
+            pipe.pexpire(file_key, ttl)
+
+        self.redis_client.transaction(migrate, file_key)
+
+    def execute_file_reads(self, file_key, queue_reads):
+        # queue_reads must queue the key's TTL last; a -2 from a replica may
+        # just be replication lag right after an upload.
+        results = self.run_replica_pipeline(queue_reads)
+        if (
+            results is not None
+            and not any(is_wrong_type(result) for result in results)
+            and results[-1] != -2
+        ):
+            return raise_errors(results)
+
+        for attempt in range(2):
+            results = self.run_pipeline(self.redis_client, queue_reads)
+
+            if attempt == 0 and any(is_wrong_type(result) for result in results):
+                self.migrate_legacy_file(file_key)
+                continue
+
+            return raise_errors(results)
+
+    @staticmethod
+    def queue_file_meta(pipe, file_key):
+        pipe.hmget(file_key, FILE_META_FIELDS + ("size", "bundle"))
+        # Shares written before the size field existed.
+        pipe.hstrlen(file_key, "code")
+        pipe.ttl(file_key)
+
+    @translate_errors
+    def put(self, share_id, record, ttl, owner=None):
+        # The owner's index lives in another cluster slot, so it cannot
+        # share a MULTI with the file there.
+        raise_errors(
+            self.run_pipeline(
+                self.redis_client,
+                lambda pipe: queue_share_writes(pipe, share_id, record, ttl, owner),
+                transaction=not REDIS_CLUSTER,
+            )
+        )
+
+    @translate_errors
+    def get(self, share_id):
+        file_key = file_key_for(share_id)
+        record, ttl = self.execute_file_reads(
+            file_key, lambda pipe: (pipe.hgetall(file_key), pipe.ttl(file_key))
+        )
+        return record or None, ttl
+
+    @translate_errors
+    def get_etag(self, share_id):
+        file_key = file_key_for(share_id)
+        etag, ttl = self.execute_file_reads(
+            file_key, lambda pipe: (pipe.hget(file_key, "etag"), pipe.ttl(file_key))
+        )
+        return etag, ttl
+
+    @translate_errors
+    def get_meta(self, share_ids):
+        file_keys = [file_key_for(share_id) for share_id in share_ids]
+        file_metas = [None] * len(file_keys)
+
+        def queue_reads(pipe):
+            for index in pending:
+                self.queue_file_meta(pipe, file_keys[index])
+
+        # One replica pass, then up to two primary passes: IDs the replica
+        # did not know and legacy keys, then the legacy keys once migrated.
+        pending = list(range(len(file_keys)))
+        passes = ["primary", "migrated"]
+        if self.replicas:
+            passes.insert(0, "replica")
+        for current_pass in passes:
+            if current_pass == "replica":
+                results = self.run_replica_pipeline(queue_reads)
+                if results is None:
+                    continue
+            else:
+                results = self.run_pipeline(self.redis_client, queue_reads)
+
+            retry = []
+            for offset, index in enumerate(pending):
+                meta_values, code_size, ttl = results[offset * 3 : offset * 3 + 3]
+
+                if current_pass != "migrated" and is_wrong_type(meta_values):
+                    retry.append(index)
+                    if current_pass == "primary":
+                        self.migrate_legacy_file(file_keys[index])
+                    continue
+                raise_errors((meta_values, code_size, ttl))
+                if current_pass == "replica" and ttl == -2:
+                    retry.append(index)
+                    continue
+
+                file_meta = None
+                if ttl > 0:
+                    *meta_values, size, bundle = meta_values
+                    size = int(size) if size is not None else code_size
+                    file_meta = build_file_meta(meta_values, size, bundle)
+                file_metas[index] = (file_meta, ttl)
+
+            if not retry:
+                break
+            pending = retry
+
+        return file_metas
+
+    @translate_errors
+    def get_bundle_file(self, share_id, name):
+        file_key = file_key_for(share_id)
+        content, ttl = self.execute_file_reads(
+            file_key,
+            lambda pipe: (
+                pipe.hget(file_key, BUNDLE_FILE_PREFIX + name),
+                pipe.ttl(file_key),
+            ),
+        )
+        return content, ttl
+
+    @translate_errors
+    def append_chunk(self, share_id, chunk, ttl):
+        chunks_key = chunks_key_for(share_id)
+        raise_errors(
+            self.run_pipeline(
+                self.redis_client,
+                lambda pipe: (
+                    pipe.rpush(chunks_key, chunk),
+                    pipe.expire(chunks_key, ttl),
+                ),
+            )
+        )
+
+    def iter_chunks(self, share_id, chunks):
+        chunks_key = chunks_key_for(share_id)
+        for index in range(chunks):
+            try:
+                results = self.run_replica_pipeline(
+                    lambda pipe: pipe.lindex(chunks_key, index)
+                )
+                chunk = results[0] if results else None
+                if chunk is None:
+                    [chunk] = self.run_pipeline(
+                        self.redis_client, lambda pipe: pipe.lindex(chunks_key, index)
+                    )
+            except redis.RedisError as e:
+                raise StorageError(str(e)) from e
+            if isinstance(chunk, Exception):
+                raise StorageError(str(chunk))
+            if chunk is None:
+                raise StorageError(f"Chunk {index} of {share_id} is missing")
+            yield chunk
+
+    @translate_errors
+    def list_user_shares(self, owner, cursor, limit):
+        # Members are scored by expiry in milliseconds, so everything below
+        # "now" is dead and a page is a range scan from the cursor.
+        user_key = user_shares_key_for(owner)
+        now = int(time.time() * 1000)
+        start, after = page_start(cursor, now)
+
+        def queue_commands(pipe):
+            pipe.zremrangebyscore(user_key, "-inf", now)
+            # Members with the cursor's score come back in member order;
+            # the page resumes after the cursor's share ID among them.
+            pipe.zrangebyscore(user_key, start, start, withscores=True)
+            pipe.zrangebyscore(
+                user_key, f"({start}", "+inf", start=0, num=limit, withscores=True
+            )
+            pipe.zcard(user_key)
+
+        _, tied, entries, total = raise_errors(
+            self.run_pipeline(self.redis_client, queue_commands)
+        )
+        if after is not None:
+            entries = [entry for entry in tied if entry[0] > after] + entries
+
+        return [(share_id, int(score)) for share_id, score in entries[:limit]], total
+
+    @translate_errors
+    def record_views(self, batch):
+        # batch maps share IDs to [views, viewer hashes, remaining TTL]. The
+        # counters expire with their share; the leaderboard is trimmed to
+        # MAX_TOP_SHARES and dead members are dropped on read.
+        def queue_writes(pipe):
+            for share_id, (views, viewers, ttl) in batch.items():
+                views_key = views_key_for(share_id)
+                viewers_key = viewers_key_for(share_id)
+                pipe.incrby(views_key, views)
+                pipe.expire(views_key, ttl)
+                pipe.pfadd(viewers_key, *viewers)
+                pipe.expire(viewers_key, ttl)
+                pipe.zincrby(TOP_SHARES_KEY, views, share_id)
+            pipe.zremrangebyrank(TOP_SHARES_KEY, 0, -MAX_TOP_SHARES - 1)
+
+        raise_errors(self.run_pipeline(self.redis_client, queue_writes))
+
+    @translate_errors
+    def top_shares(self, limit):
+        top = []
+        offset = 0
+
+        while len(top) < limit:
+            [entries] = raise_errors(
+                self.run_pipeline(
+                    self.redis_client,
+                    lambda pipe: pipe.zrange(
+                        TOP_SHARES_KEY, offset, offset + limit - 1, desc=True
+                    ),
+                )
+            )
+            if not entries:
+                break
+
+            def queue_reads(pipe):
+                for share_id in entries:
+                    pipe.get(views_key_for(share_id))
+                    pipe.pfcount(viewers_key_for(share_id))
+
+            results = raise_errors(self.run_pipeline(self.redis_client, queue_reads))
+
+            expired = []
+            for share_id, views, viewers in zip(entries, results[::2], results[1::2]):
+                if views is None:
+                    expired.append(share_id)
+                    continue
+                top.append(
+                    {"shareId": share_id, "views": int(views), "uniqueViewers": viewers}
+                )
+
+            if expired:
+                self.redis_client.zrem(TOP_SHARES_KEY, *expired)
+            offset += len(entries) - len(expired)
+
+        return top[:limit]
+
+    @translate_errors
+    def delete(self, share_id, owner=None):
+        return bool(
+            raise_errors(
+                self.run_pipeline(
+                    self.redis_client,
+                    lambda pipe: queue_share_deletes(pipe, share_id, owner),
+                )
+            )[0]
+        )
+
+
+class AsyncRedisStorage:
+    # redis.asyncio counterpart of RedisStorage for async_app.py, covering
+    # the calls that app serves. Same keys, records and TTL conventions;
+    # every command goes to the primary through one shared pool.
+
+    def __init__(self):
+        self.redis_client = None
+
+    async def open(self):
+        redis_class = aioredis.RedisCluster if REDIS_CLUSTER else aioredis.Redis
+        self.redis_client = redis_class(
+            host=os.getenv("REDIS_HOST"),
+            port=int(os.getenv("REDIS_PORT")),
+            password=os.getenv("REDIS_PASSWORD"),
+            ssl=REDIS_SSL,
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+        )
+        await self.redis_client.ping()
+
+    async def close(self):
+        await self.redis_client.aclose()
+
+    async def run_pipeline(self, queue_commands, transaction=False):
+        pipe = self.redis_client.pipeline(transaction=transaction)
+        queue_commands(pipe)
+        return await pipe.execute(raise_on_error=False)
+
+    async def migrate_legacy_file(self, file_key):
+        async def migrate(pipe):
+            try:
+                legacy_data = await pipe.get(file_key)
+            except redis.ResponseError:
+                return
+            ttl = await pipe.pttl(file_key)
+            if not legacy_data or ttl <= 0:
+                return
+            pipe.multi()
+            pipe.delete(file_key)
+            pipe.hset(file_key, mapping=encode_file_data(json.loads(legacy_data)))
+            pipe.pexpire(file_key, ttl)
+
+        await self.redis_client.transaction(migrate, file_key)
+
+    async def execute_file_reads(self, file_key, queue_reads):
+        for attempt in range(2):
+            results = await self.run_pipeline(queue_reads)
+
+            if attempt == 0 and any(is_wrong_type(result) for result in results):
+                await self.migrate_legacy_file(file_key)
+                continue
+
+            return raise_errors(results)
+
+    @async_translate_errors
+    async def put(self, share_id, record, ttl, owner=None):
+        raise_errors(
+            await self.run_pipeline(
+                lambda pipe: queue_share_writes(pipe, share_id, record, ttl, owner),
+                transaction=not REDIS_CLUSTER,
+            )
+        )
+
+    @async_translate_errors
+    async def get(self, share_id):
+        file_key = file_key_for(share_id)
+        record, ttl = await self.execute_file_reads(
+            file_key, lambda pipe: (pipe.hgetall(file_key), pipe.ttl(file_key))
+        )
+        return record or None, ttl
+
+    @async_translate_errors
+    async def get_etag(self, share_id):
+        file_key = file_key_for(share_id)
+        etag, ttl = await self.execute_file_reads(
+            file_key, lambda pipe: (pipe.hget(file_key, "etag"), pipe.ttl(file_key))
+        )
+        return etag, ttl
+
+    async def iter_chunks(self, share_id, chunks):
+        chunks_key = chunks_key_for(share_id)
+        for index in range(chunks):
+            try:
+                chunk = await self.redis_client.lindex(chunks_key, index)
+            except redis.RedisError as e:
+                raise StorageError(str(e)) from e
+            if chunk is None:
+                raise StorageError(f"Chunk {index} of {share_id} is missing")
+            yield chunk
+
+    @async_translate_errors
+    async def delete(self, share_id, owner=None):
+        results = await self.run_pipeline(
+            lambda pipe: queue_share_deletes(pipe, share_id, owner)
+        )
+        return bool(raise_errors(results)[0])
+
+
+class SQLiteStorage:
+    # Embedded single-node backend. Rows carry an absolute expiry; reads
+    # ignore expired rows and a background thread deletes them in batches.
+
+    def __init__(self, path, sweep_interval=60):
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    share_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    code TEXT,
+                    language TEXT NOT NULL,
+                    expiry_time TEXT NOT NULL,
+                    encoding TEXT,
+                    etag TEXT,
+                    bundle TEXT,
+                    chunks INTEGER,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_expires_at ON files (expires_at)"
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_shares (
+                    user_id TEXT NOT NULL,
+                    share_id TEXT NOT NULL,
+                    expires_at INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, share_id)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_user_shares_expires_at
+                ON user_shares (user_id, expires_at)
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_chunks (
+                    share_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (share_id, seq)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_file_chunks_expires_at
+                ON file_chunks (expires_at)
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bundle_files (
+                    share_id TEXT NOT NULL
+                        REFERENCES files (share_id) ON DELETE CASCADE,
+                    name TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (share_id, name)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS share_views (
+                    share_id TEXT PRIMARY KEY,
+                    views INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_share_views_views ON share_views (views)"
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS share_viewers (
+                    share_id TEXT NOT NULL,
+                    viewer TEXT NOT NULL,
+                    PRIMARY KEY (share_id, viewer)
+                )
+                """
+            )
+
+        self.sweeper = threading.Thread(
+            target=self.sweep_forever, args=(sweep_interval,), daemon=True
+        )
+        self.sweeper.start()
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self.local.connection = connection
+        return connection
+
+    def sweep_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                pass
+
+    def sweep(self):
+        now = time.time()
+        with self.connection() as connection:
+            connection.execute(
+                "DELETE FROM user_shares WHERE expires_at <= ?", (int(now * 1000),)
+            )
+            connection.execute("DELETE FROM file_chunks WHERE expires_at <= ?", (now,))
+            connection.execute("DELETE FROM share_views WHERE expires_at <= ?", (now,))
+            connection.execute(
+                """
+                DELETE FROM share_viewers
+                WHERE share_id NOT IN (SELECT share_id FROM share_views)
+                """
+            )
+            return connection.execute(
+                "DELETE FROM files WHERE expires_at <= ?", (now,)
+            ).rowcount
+
+    @staticmethod
+    def remaining_ttl(row):
+        if row is None:
+            return -2
+        ttl = int(row["expires_at"] - time.time())
+        return ttl if ttl > 0 else -2
+
+    @translate_errors
+    def put(self, share_id, record, ttl, owner=None):
+        split_share_id(share_id)
+        with self.connection() as connection:
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO files
+                    (share_id, title, code, language, expiry_time, encoding,
+                     etag, bundle, chunks, size, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    share_id,
+                    record["title"],
+                    record.get("code"),
+                    record["language"],
+                    record["expiry_time"],
+                    record.get("encoding"),
+                    record.get("etag"),
+                    record.get("bundle"),
+                    record.get("chunks"),
+                    record["size"],
+                    time.time() + ttl,
+                ),
+            )
+            if record.get("bundle"):
+                connection.executemany(
+                    "INSERT INTO bundle_files (share_id, name, content) VALUES (?, ?, ?)",
+                    (
+                        (share_id, name, record[BUNDLE_FILE_PREFIX + name])
+                        for name in json.loads(record["bundle"])
+                    ),
+                )
+            if owner:
+                connection.execute(
+                    """
+                    INSERT OR REPLACE INTO user_shares (user_id, share_id, expires_at)
+                    VALUES (?, ?, ?)
+                    """,
+                    (owner, share_id, int((time.time() + ttl) * 1000)),
+                )
+
+    @translate_errors
+    def get(self, share_id):
+        split_share_id(share_id)
+        row = (
+            self.connection()
+            .execute("SELECT * FROM files WHERE share_id = ?", (share_id,))
+            .fetchone()
+        )
+        ttl = self.remaining_ttl(row)
+        if ttl < 0:
+            return None, ttl
+        record = {
+            key: row[key]
+            for key in FILE_FIELDS + ("encoding", "etag", "bundle", "chunks")
+            if row[key] is not None
+        }
+        if row["bundle"]:
+            for name, content in self.connection().execute(
+                "SELECT name, content FROM bundle_files WHERE share_id = ?",
+                (share_id,),
+            ):
+                record[BUNDLE_FILE_PREFIX + name] = content
+        return record, ttl
+
+    @translate_errors
+    def get_etag(self, share_id):
+        split_share_id(share_id)
+        row = (
+            self.connection()
+            .execute(
+                "SELECT etag, expires_at FROM files WHERE share_id = ?", (share_id,)
+            )
+            .fetchone()
+        )
+        ttl = self.remaining_ttl(row)
+        return (row["etag"] if ttl > 0 else None), ttl
+
+    @translate_errors
+    def get_meta(self, share_ids):
+        for share_id in share_ids:
+            split_share_id(share_id)
+
+        rows = {}
+        unique_ids = list(dict.fromkeys(share_ids))
+        # Stay well below SQLite's bound-parameter limit.
+        for start in range(0, len(unique_ids), 500):
+            chunk = unique_ids[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.connection().execute(
+                f"""
+                SELECT share_id, title, language, expiry_time, size, bundle,
+                       expires_at
+                FROM files WHERE share_id IN ({placeholders})
+                """,
+                chunk,
+            ):
+                rows[row["share_id"]] = row
+
+        file_metas = []
+        for share_id in share_ids:
+            row = rows.get(share_id)
+            ttl = self.remaining_ttl(row)
+            file_meta = (
+                build_file_meta(
+                    [row[field] for field in FILE_META_FIELDS],
+                    row["size"],
+                    row["bundle"],
+                )
+                if ttl > 0
+                else None
+            )
+            file_metas.append((file_meta, ttl))
+        return file_metas
+
+    @translate_errors
+    def get_bundle_file(self, share_id, name):
+        split_share_id(share_id)
+        row = (
+            self.connection()
+            .execute(
+                """
+                SELECT bundle_files.content, files.expires_at
+                FROM files
+                LEFT JOIN bundle_files
+                    ON bundle_files.share_id = files.share_id
+                    AND bundle_files.name = ?
+                WHERE files.share_id = ?
+                """,
+                (name, share_id),
+            )
+            .fetchone()
+        )
+        ttl = self.remaining_ttl(row)
+        return (row["content"] if ttl > 0 else None), ttl
+
+    @translate_errors
+    def append_chunk(self, share_id, chunk, ttl):
+        split_share_id(share_id)
+        with self.connection() as connection:
+            connection.execute(
+                """
+                INSERT INTO file_chunks (share_id, seq, content, expires_at)
+                SELECT ?, coalesce(max(seq) + 1, 0), ?, ?
+                FROM file_chunks WHERE share_id = ?
+                """,
+                (share_id, chunk, time.time() + ttl, share_id),
+            )
+
+    def iter_chunks(self, share_id, chunks):
+        try:
+            rows = self.connection().execute(
+                "SELECT content FROM file_chunks WHERE share_id = ? ORDER BY seq",
+                (share_id,),
+            )
+            for row in rows:
+                yield row["content"]
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def node_stats(self):
+        return {}
+
+    @translate_errors
+    def list_user_shares(self, owner, cursor, limit):
+        now = int(time.time() * 1000)
+        start, after = page_start(cursor, now)
+
+        with self.connection() as connection:
+            connection.execute(
+                "DELETE FROM user_shares WHERE user_id = ? AND expires_at <= ?",
+                (owner, now),
+            )
+            entries = connection.execute(
+                """
+                SELECT share_id, expires_at FROM user_shares
+                WHERE user_id = ?
+                    AND (expires_at > ? OR (expires_at = ? AND share_id > ?))
+                ORDER BY expires_at, share_id
+                LIMIT ?
+                """,
+                (owner, start, start, after, limit),
+            ).fetchall()
+            total = connection.execute(
+                "SELECT count(*) FROM user_shares WHERE user_id = ?", (owner,)
+            ).fetchone()[0]
+
+        return [(row["share_id"], row["expires_at"]) for row in entries], total
+
+    @translate_errors
+    def record_views(self, batch):
+        # SQLite has no HyperLogLog, so unique viewers are counted exactly.
+        now = time.time()
+        with self.connection() as connection:
+            connection.executemany(
+                """
+                INSERT INTO share_views (share_id, views, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (share_id) DO UPDATE SET
+                    views = views + excluded.views,
+                    expires_at = excluded.expires_at
+                """,
+                [
+                    (share_id, views, now + ttl)
+                    for share_id, (views, _, ttl) in batch.items()
+                ],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO share_viewers (share_id, viewer) VALUES (?, ?)",
+                [
+                    (share_id, viewer)
+                    for share_id, (_, viewers, _) in batch.items()
+                    for viewer in viewers
+                ],
+            )
+
+    @translate_errors
+    def top_shares(self, limit):
+        rows = self.connection().execute(
+            """
+            SELECT share_id, views, (
+                SELECT count(*) FROM share_viewers
+                WHERE share_viewers.share_id = share_views.share_id
+            ) AS viewers
+            FROM share_views
+            WHERE expires_at > ?
+            ORDER BY views DESC
+            LIMIT ?
+            """,
+            (time.time(), limit),
+        ).fetchall()
+
+        return [
+            {
+                "shareId": row["share_id"],
+                "views": row["views"],
+                "uniqueViewers": row["viewers"],
+            }
+            for row in rows
+        ]
+
+    @translate_errors
+    def delete(self, share_id, owner=None):
+        split_share_id(share_id)
+        with self.connection() as connection:
+            connection.execute("DELETE FROM share_views WHERE share_id = ?", (share_id,))
+            connection.execute(
+                "DELETE FROM share_viewers WHERE share_id = ?", (share_id,)
+            )
+            if owner:
+                connection.execute(
+                    "DELETE FROM user_shares WHERE user_id = ? AND share_id = ?",
+                    (owner, share_id),
+                )
+            connection.execute(
+                "DELETE FROM file_chunks WHERE share_id = ?", (share_id,)
+            )
+            return (
+                connection.execute(
+                    "DELETE FROM files WHERE share_id = ?", (share_id,)
+                ).rowcount
+                > 0
+            )
+
+
+def create_storage():
+    backend = os.getenv("STORAGE_BACKEND", "redis").lower()
+
+    if backend == "redis":
+        return RedisStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(
+            os.getenv("SQLITE_PATH", "tempfile.db"),
+            sweep_interval=int(os.getenv("SQLITE_SWEEP_INTERVAL", 60)),
+        )
+
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'")
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import functools
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py opens its storage at import; point it at a throwaway SQLite file.
+os.environ.setdefault("JWT_SECRET", "test-secret-" + "x" * 20)
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "import.db")
+
+import storage
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == "redis":
+        monkeypatch.setenv("REDIS_HOST", "localhost")
+        monkeypatch.setenv("REDIS_PORT", "6379")
+        monkeypatch.setattr(
+            storage.redis,
+            "StrictRedis",
+            functools.partial(fakeredis.FakeStrictRedis, server=fakeredis.FakeServer()),
+        )
+        return storage.RedisStorage()
+    return storage.SQLiteStorage(str(tmp_path / "tempfile.db"), sweep_interval=3600)
+
+
+@pytest.fixture
+def replicated(monkeypatch):
+    # A primary and one replica on separate fake servers; nothing
+    # replicates, so each test decides what the replica has.
+    servers = {
+        "localhost:6379": fakeredis.FakeServer(),
+        "replica:6380": fakeredis.FakeServer(),
+    }
+
+    def connect(host, port, **kwargs):
+        return fakeredis.FakeStrictRedis(
+            server=servers[f"{host}:{port}"], decode_responses=True
+        )
+
+    monkeypatch.setenv("REDIS_HOST", "localhost")
+    monkeypatch.setenv("REDIS_PORT", "6379")
+    monkeypatch.setattr(storage, "REDIS_REPLICAS", ["replica:6380"])
+    monkeypatch.setattr(storage.redis, "StrictRedis", connect)
+    backend = storage.RedisStorage()
+    backend.replica_server = servers["replica:6380"]
+    return backend
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "storage", backend)
+    monkeypatch.setattr(app, "view_counter", storage.ViewCounter(backend, 3600))
+    return app.app.test_client()
@@ -0,0 +1,365 @@
+import json
+import time
+import jwt
+import pytest
+import storage
+from http_utils import SECRET_KEY
+from storage import (
+    new_file_id,
+    encode_file_data,
+    encode_chunked_file_data,
+    decode_file_data,
+)
+
+FILE_DATA = {
+    "title": "hello",
+    "language": "python",
+    "expiry_time": "2030-01-01 00:00:00 UTC",
+    "code": "print('hello')\n",
+}
+
+
+def new_share_id(language="python"):
+    return f"{language}-{new_file_id()}"
+
+
+def token(user_id="user-1"):
+    return jwt.encode({"userId": user_id}, SECRET_KEY, algorithm="HS256")
+
+
+def replicate(backend, share_id):
+    file_key = storage.file_key_for(share_id)
+    backend.replicas[0].restore(
+        file_key,
+        backend.redis_client.pttl(file_key),
+        backend.redis_client.dump(file_key),
+    )
+
+
+def pipeline_log(backend, monkeypatch):
+    # (node, commands) for every pipeline the backend runs.
+    calls = []
+    run_pipeline = backend.run_pipeline
+
+    def logged(client, queue_commands, transaction=False):
+        def queue(pipe):
+            queue_commands(pipe)
+            calls.append((backend.node_names[id(client)], len(pipe.command_stack)))
+
+        return run_pipeline(client, queue, transaction)
+
+    monkeypatch.setattr(backend, "run_pipeline", logged)
+    return calls
+
+
+def test_put_get(backend):
+    share_id = new_share_id()
+    backend.put(share_id, encode_file_data(FILE_DATA), 600)
+
+    record, ttl = backend.get(share_id)
+
+    assert 590 < ttl <= 600
+    assert decode_file_data(record) == FILE_DATA
+
+
+def test_put_get_json_code(backend):
+    share_id = new_share_id()
+    file_data = {**FILE_DATA, "code": ["not", "a", "string"]}
+    backend.put(share_id, encode_file_data(file_data), 600)
+
+    record, _ = backend.get(share_id)
+
+    assert decode_file_data(record) == file_data
+
+
+def test_get_missing(backend):
+    assert backend.get(new_share_id()) == (None, -2)
+    assert backend.get_etag(new_share_id()) == (None, -2)
+
+
+def test_etag(backend):
+    share_id = new_share_id()
+    record = encode_file_data(FILE_DATA)
+    backend.put(share_id, record, 600)
+
+    etag, ttl = backend.get_etag(share_id)
+
+    assert etag == record["etag"]
+    assert ttl > 0
+
+
+def test_not_modified(client):
+    response = client.post(
+        "/temp-file-upload",
+        json={**FILE_DATA, "expiryTime": 10},
+        headers={"Authorization": f"Bearer {token()}"},
+    )
+    share_id = response.get_json()["fileUrl"].rsplit("/", 1)[1]
+
+    first = client.get(f"/file/{share_id}", headers={"X-File-ID": share_id})
+    second = client.get(
+        f"/file/{share_id}",
+        headers={"X-File-ID": share_id, "If-None-Match": first.headers["ETag"]},
+    )
+
+    assert first.status_code == 200
+    assert first.get_json()["code"] == FILE_DATA["code"]
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_view_embeds_share(client):
+    response = client.post(
+        "/temp-file-upload",
+        json={**FILE_DATA, "code": "</script><b>x</b>", "expiryTime": 10},
+        headers={"Authorization": f"Bearer {token()}"},
+    )
+    share_id = response.get_json()["fileUrl"].rsplit("/", 1)[1]
+
+    # A plain navigation, with no X-File-ID header.
+    response = client.get(f"/view/{share_id}")
+    page = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert "&lt;/script&gt;&lt;b&gt;x&lt;/b&gt;" in page
+    embedded = page.split('<script id="__share_data__" type="application/json">')[1]
+    share = json.loads(embedded.split("</script>")[0])
+    assert share["code"] == "</script><b>x</b>"
+    assert share["shareId"] == share_id
+    assert client.get(f"/view/{new_share_id()}").status_code == 404
+
+
+def test_view_boots_spa(client, tmp_path, monkeypatch):
+    import app
+
+    index = tmp_path / "index.html"
+    index.write_text(
+        '<html><head><script type="module" crossorigin src="/assets/index.js">'
+        '</script><link rel="stylesheet" crossorigin href="/assets/index.css">'
+        "</head><body></body></html>"
+    )
+    monkeypatch.setattr(app, "SPA_INDEX_PATH", str(index))
+    monkeypatch.setattr(app, "SPA_ORIGIN", "https://spa.example")
+    monkeypatch.setattr(app, "spa_head", app.load_spa_head())
+    response = client.post(
+        "/temp-file-upload",
+        json={**FILE_DATA, "expiryTime": 10},
+        headers={"Authorization": f"Bearer {token()}"},
+    )
+    share_id = response.get_json()["fileUrl"].rsplit("/", 1)[1]
+
+    page = client.get(f"/view/{share_id}").get_data(as_text=True)
+
+    assert 'src="https://spa.example/assets/index.js"' in page
+    assert 'href="https://spa.example/assets/index.css"' in page
+    assert '<div id="root">' in page
+
+
+def test_meta(backend):
+    share_id = new_share_id()
+    backend.put(share_id, encode_file_data(FILE_DATA), 600)
+    missing_id = new_share_id()
+
+    [(file_meta, ttl), (missing_meta, missing_ttl)] = backend.get_meta(
+        [share_id, missing_id]
+    )
+
+    assert file_meta == {
+        "title": FILE_DATA["title"],
+        "language": FILE_DATA["language"],
+        "expiry_time": FILE_DATA["expiry_time"],
+        "size": len(FILE_DATA["code"]),
+    }
+    assert ttl > 0
+    assert (missing_meta, missing_ttl) == (None, -2)
+
+
+def test_bundle(backend):
+    share_id = new_share_id("htmlcssjs")
+    files = {"index.html": "<p>hi</p>", "style.css": "p { color: red; }"}
+    file_data = {key: FILE_DATA[key] for key in ("title", "expiry_time")}
+    file_data.update(language="htmlcssjs", files=files)
+    backend.put(share_id, encode_file_data(file_data), 600)
+
+    record, _ = backend.get(share_id)
+    [(file_meta, _)] = backend.get_meta([share_id])
+
+    assert decode_file_data(record)["files"] == files
+    assert file_meta["files"] == list(files)
+    assert backend.get_bundle_file(share_id, "style.css")[0] == files["style.css"]
+    assert backend.get_bundle_file(share_id, "missing.js")[0] is None
+    assert backend.get_bundle_file(new_share_id(), "style.css") == (None, -2)
+
+
+def test_chunks(backend):
+    share_id = new_share_id()
+    chunks = ['print("a")\n', "é" * 10, "\n"]
+    for chunk in chunks:
+        backend.append_chunk(share_id, chunk, 600)
+    record = encode_chunked_file_data(
+        {key: FILE_DATA[key] for key in ("title", "language", "expiry_time")},
+        "digest",
+        sum(len(chunk.encode("utf-8")) for chunk in chunks),
+        len(chunks),
+    )
+    backend.put(share_id, record, 600)
+
+    stored, _ = backend.get(share_id)
+
+    assert int(stored["chunks"]) == len(chunks)
+    assert list(backend.iter_chunks(share_id, len(chunks))) == chunks
+
+
+def test_streamed_download(client):
+    code = 'print("streamed")\n' * 100
+    response = client.post(
+        "/temp-file-upload/stream?language=python&title=big&expiryTime=10",
+        data=code.encode("utf-8"),
+        headers={"Authorization": f"Bearer {token()}"},
+    )
+    share_id = response.get_json()["fileUrl"].rsplit("/", 1)[1]
+
+    response = client.get(f"/file/{share_id}", headers={"X-File-ID": share_id})
+
+    assert response.status_code == 200
+    assert response.get_json()["code"] == code
+
+
+def test_delete(backend):
+    share_id = new_share_id()
+    backend.append_chunk(share_id, "chunk", 600)
+    backend.put(share_id, encode_file_data(FILE_DATA), 600, owner="user-1")
+    backend.record_views({share_id: [3, {"viewer"}, 600]})
+
+    assert backend.delete(share_id, owner="user-1") is True
+    assert backend.delete(share_id, owner="user-1") is False
+    assert backend.get(share_id) == (None, -2)
+    assert list(backend.iter_chunks(share_id, 0)) == []
+    assert backend.list_user_shares("user-1", None, 10) == ([], 0)
+    assert backend.top_shares(10) == []
+
+
+def test_expiry(backend):
+    share_id = new_share_id()
+    backend.put(share_id, encode_file_data(FILE_DATA), 1, owner="user-1")
+
+    time.sleep(1.1)
+
+    assert backend.get(share_id) == (None, -2)
+    assert backend.get_meta([share_id]) == [(None, -2)]
+    assert backend.list_user_shares("user-1", None, 10) == ([], 0)
+
+
+def test_list_user_shares_pages_through_ties(backend, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    share_ids = sorted(new_share_id() for _ in range(5))
+    for share_id in share_ids:
+        backend.put(share_id, encode_file_data(FILE_DATA), 600, owner="user-1")
+
+    listed = []
+    cursor = None
+    while True:
+        entries, total = backend.list_user_shares("user-1", cursor, 2)
+        listed += [share_id for share_id, _ in entries]
+        if len(entries) < 2:
+            break
+        cursor = (entries[-1][1], entries[-1][0])
+
+    assert listed == share_ids
+    assert total == len(share_ids)
+
+
+@pytest.mark.parametrize("views", [1, 5])
+def test_top_shares(backend, views):
+    share_id = new_share_id()
+    backend.put(share_id, encode_file_data(FILE_DATA), 600)
+    backend.record_views({share_id: [views, {"a", "b"}, 600]})
+
+    assert backend.top_shares(10) == [
+        {"shareId": share_id, "views": views, "uniqueViewers": 2}
+    ]
+
+
+def test_replica_read(replicated, monkeypatch):
+    share_id = new_share_id()
+    replicated.put(share_id, encode_file_data(FILE_DATA), 600)
+    replicate(replicated, share_id)
+    calls = pipeline_log(replicated, monkeypatch)
+
+    record, _ = replicated.get(share_id)
+
+    assert decode_file_data(record) == FILE_DATA
+    assert calls == [("replica:6380", 2)]
+
+
+def test_lagging_replica_falls_back_to_primary(replicated, monkeypatch):
+    share_id = new_share_id()
+    replicated.put(share_id, encode_file_data(FILE_DATA), 600)
+    calls = pipeline_log(replicated, monkeypatch)
+
+    record, ttl = replicated.get(share_id)
+
+    assert decode_file_data(record) == FILE_DATA
+    assert ttl > 0
+    assert calls == [("replica:6380", 2), ("localhost:6379", 2)]
+
+
+def test_down_replica_is_skipped(replicated, monkeypatch):
+    monkeypatch.setattr(storage, "REPLICA_RETRY_AFTER", 0.5)
+    share_id = new_share_id()
+    replicated.put(share_id, encode_file_data(FILE_DATA), 600)
+    replicate(replicated, share_id)
+    calls = pipeline_log(replicated, monkeypatch)
+    replicated.replica_server.connected = False
+
+    assert decode_file_data(replicated.get(share_id)[0]) == FILE_DATA
+    replicated.replica_server.connected = True
+    assert decode_file_data(replicated.get(share_id)[0]) == FILE_DATA
+
+    # The failed replica call, then the primary for both reads.
+    assert calls == [
+        ("replica:6380", 2),
+        ("localhost:6379", 2),
+        ("localhost:6379", 2),
+    ]
+    assert replicated.node_stats()["replica:6380"]["errors"] == 1
+
+    time.sleep(0.5)
+    calls.clear()
+    replicated.get(share_id)
+
+    assert calls == [("replica:6380", 2)]
+
+
+def test_meta_rechecks_only_missing_ids(replicated, monkeypatch):
+    share_ids = [new_share_id() for _ in range(3)]
+    for share_id in share_ids:
+        replicated.put(share_id, encode_file_data(FILE_DATA), 600)
+    replicate(replicated, share_ids[0])
+    replicate(replicated, share_ids[2])
+    calls = pipeline_log(replicated, monkeypatch)
+
+    metas = replicated.get_meta(share_ids)
+
+    assert [meta["title"] for meta, _ in metas] == [FILE_DATA["title"]] * 3
+    # Three commands per ID: the replica gets all three IDs, the primary
+    # only the one the replica did not have yet.
+    assert calls == [("replica:6380", 9), ("localhost:6379", 3)]
+
+
+def test_storage_metrics_admin_only(client, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "ADMIN_USER_IDS", {"admin"})
+
+    response = client.get(
+        "/metrics/storage", headers={"Authorization": f"Bearer {token()}"}
+    )
+    admin_response = client.get(
+        "/metrics/storage", headers={"Authorization": f"Bearer {token('admin')}"}
+    )
+
+    assert response.status_code == 403
+    assert admin_response.status_code == 200
+    assert "nodes" in admin_response.get_json()
@@ -21,6 +21,27 @@ import { FaMagic, FaTrashAlt, FaShare } from "react-icons/fa";
 import { BiTerminal } from "react-icons/bi";
 import Swal from "sweetalert2/dist/sweetalert2.js";
 
+// A random ID per browser tab. Runs are superseded only by a newer Run
+// from the same tab and editor, never by other users behind the same IP.
+const TAB_ID_KEY = "__editorTabId__";
+
+const getTabId = () => {
+  let tabId = sessionStorage.getItem(TAB_ID_KEY);
+  if (!tabId) {
+    tabId = Array.from(crypto.getRandomValues(new Uint8Array(16)), (byte) =>
+      byte.toString(16).padStart(2, "0")
+    ).join("");
+    sessionStorage.setItem(TAB_ID_KEY, tabId);
+  }
+  return tabId;
+};
+
+// Signed-in runs are charged to the user's token budget.
+const authHeaders = () => {
+  const token = localStorage.getItem(LOCAL_STORAGE_TOKEN_KEY);
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
 const CodeEditor = ({
   title,
   language,
@@ -139,6 +160,28 @@ const CodeEditor = ({
     }
   }, [code, output, language]);
 
+  useEffect(() => {
+    if (code.trim().length === 0) return;
+
+    // Warm the output once typing stops so a Run can pick it up.
+    const prefetchTimeoutId = setTimeout(() => {
+      fetch(`${apiEndpoint}/prefetch`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-Editor-ID": `${getTabId()}:${shareIdData || language}`,
+          ...authHeaders(),
+        },
+        body: JSON.stringify({
+          language: language,
+          code: code,
+        }),
+      }).catch(() => {});
+    }, 1500);
+
+    return () => clearTimeout(prefetchTimeoutId);
+  }, [code, language]);
+
   const handleEditorDidMount = (editor, monaco) => {
     editorRef.current = editor;
   };
@@ -154,6 +197,8 @@ const CodeEditor = ({
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          "X-Editor-ID": `${getTabId()}:${shareIdData || language}`,
+          ...authHeaders(),
         },
         body: JSON.stringify({
           language: language,
@@ -169,7 +214,7 @@ const CodeEditor = ({
         }
 
         setOutput(
-          result.output
+          (result.output || "")
             .replace(/^```(text|javascript|json)[\r\n]*/m, "")
             .replace(/^```[\r\n]*/m, "")
             .replace(/[\r\n]*```$/m, "") || "No output returned."
@@ -19,6 +19,66 @@ import { FaSpinner, FaDownload, FaWrench } from "react-icons/fa6";
 import { FaMagic, FaTrashAlt, FaShare } from "react-icons/fa";
 import Swal from "sweetalert2/dist/sweetalert2.js";
 
+// Hashes of documents the backend already holds for this user. Those are
+// sent by hash instead of as full text; a 412 means the backend has since
+// dropped one, so the request is repeated with everything inline.
+const knownContextHashes = new Set();
+
+const sha256Hex = async (text) => {
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest(
+    "SHA-256",
+    new TextEncoder().encode(text)
+  );
+  return Array.from(new Uint8Array(digest), (byte) =>
+    byte.toString(16).padStart(2, "0")
+  ).join("");
+};
+
+const rememberContextHashes = (result) => {
+  ["htmlHash", "cssHash", "jsHash"].forEach((field) => {
+    if (result[field]) knownContextHashes.add(result[field]);
+  });
+  return result;
+};
+
+const postWithContext = async (url, token, body, contextFields) => {
+  const hashes = {};
+  for (const [field, hashField] of Object.entries(contextFields)) {
+    if (body[field]) hashes[hashField] = await sha256Hex(body[field]);
+  }
+
+  const send = (useHashes) => {
+    const payload = { ...body };
+    if (useHashes) {
+      for (const [field, hashField] of Object.entries(contextFields)) {
+        if (hashes[hashField] && knownContextHashes.has(hashes[hashField])) {
+          delete payload[field];
+          payload[hashField] = hashes[hashField];
+        }
+      }
+    }
+    return fetch(url, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${token}`,
+      },
+      body: JSON.stringify(payload),
+    });
+  };
+
+  let response = await send(true);
+  if (response.status === 412) {
+    Object.values(hashes).forEach((hash) => knownContextHashes.delete(hash));
+    response = await send(false);
+  }
+  if (response.ok) {
+    Object.values(hashes).forEach((hash) => hash && knownContextHashes.add(hash));
+  }
+  return response;
+};
+
 const EditorSection = ({
   language,
   value,
@@ -413,21 +473,16 @@ const Editor = ({ isDarkMode, value, title, shareIdData }) => {
       if (!token) return;
 
       const generateCode = async (type, data) => {
-        const response = await fetch(
+        const response = await postWithContext(
           `${GENAI_API_URL}/htmlcssjsgenerate-code`,
-          {
-            method: "POST",
-            headers: {
-              "Content-Type": "application/json",
-              Authorization: `Bearer ${token}`,
-            },
-            body: JSON.stringify(data),
-          }
+          token,
+          data,
+          { htmlContent: "htmlHash", cssContent: "cssHash" }
         );
 
         if (!response.ok)
           throw new Error(`Failed to generate ${type.toUpperCase()}.`);
-        return await response.json();
+        return rememberContextHashes(await response.json());
       };
 
       const setCodeState = (html, css, js) => {
@@ -543,27 +598,22 @@ const Editor = ({ isDarkMode, value, title, shareIdData }) => {
       let { html, css, javascript } = editorCode;
 
       const refactor = async (type, code) => {
-        const response = await fetch(
+        const response = await postWithContext(
           `${GENAI_API_URL}/htmlcssjsrefactor-code`,
+          token,
           {
-            method: "POST",
-            headers: {
-              "Content-Type": "application/json",
-              Authorization: `Bearer ${token}`,
-            },
-            body: JSON.stringify({
-              html: code.html || html,
-              css: code.css || css,
-              javascript: code.javascript || javascript,
-              type,
-              problem_description: prompt.trim() || null,
-            }),
-          }
+            html: code.html || html,
+            css: code.css || css,
+            js: code.javascript || javascript,
+            type,
+            problem_description: prompt.trim() || null,
+          },
+          { html: "htmlHash", css: "cssHash", js: "jsHash" }
         );
 
         if (!response.ok)
           throw new Error(`Failed to refactor ${type.toUpperCase()}.`);
-        return await response.json();
+        return rememberContextHashes(await response.json());
       };
 
       const updateCodeState = (newHtml, newCss, newJs) => {
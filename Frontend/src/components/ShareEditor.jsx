@@ -57,9 +57,9 @@ const languageIcons = {
   kotlin: TbBrandKotlin,
 };
 
-const isUUIDMatch = (inputString) => {
+const isShareIdMatch = (inputString) => {
   const regex =
-    /(c|cpp|csharp|dart|go|htmlcssjs|java|javascript|julia|kotlin|mongodb|perl|python|ruby|rust|scala|sql|swift|typescript|verilog)-([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})/;
+    /(c|cpp|csharp|dart|go|htmlcssjs|java|javascript|julia|kotlin|mongodb|perl|python|ruby|rust|scala|sql|swift|typescript|verilog)-([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}|[0-9A-Za-z]{22})/;
   return regex.test(inputString);
 };
 
@@ -103,6 +103,34 @@ const ShareEditor = ({ isDarkMode }) => {
       return;
     }
 
+    const embeddedData = document.getElementById("__share_data__");
+
+    if (embeddedData) {
+      const data = JSON.parse(embeddedData.textContent);
+
+      if (data.shareId === shareId && data.code !== undefined) {
+        setState({
+          code: data.code,
+          language: data.language,
+          expiryTime: data.expiry_time,
+          title: data.title,
+          shareIdNotFound: false,
+          loading: false,
+        });
+
+        sessionStorage.setItem(
+          shareId,
+          JSON.stringify({
+            code: data.code,
+            language: data.language,
+            expiry_time: data.expiry_time,
+            title: data.title,
+          })
+        );
+        return;
+      }
+    }
+
     const fetchStatus = sessionStorage.getItem(
       SESSION_STORAGE_FETCH_STATUS_KEY
     );
@@ -230,7 +258,7 @@ const ShareEditor = ({ isDarkMode }) => {
   };
 
   useEffect(() => {
-    if (!isUUIDMatch(shareId)) {
+    if (!isShareIdMatch(shareId)) {
       setState({
         code: "",
         language: "",
@@ -225,6 +225,11 @@ const EditorRoutes = ({ isDarkMode }) => (
         element={<ShareEditor isDarkMode={isDarkMode} />}
       />
 
+      <Route
+        path="/view/:shareId"
+        element={<ShareEditor isDarkMode={isDarkMode} />}
+      />
+
       {languages.map(({ path, language, icon, sampleCode }) => (
         <Route
           key={language}